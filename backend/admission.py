@@ -0,0 +1,152 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict
+
+from observability import Counter, Histogram, registry
+from resilience import LatencyTracker
+
+admission_wait = registry.register(
+    Histogram("admission_wait_seconds", "Time spent waiting for an AI execution slot")
+)
+admission_rejected = registry.register(
+    Counter("admission_rejected_total", "Requests rejected by admission control")
+)
+
+
+class AdmissionRejected(Exception):
+    """请求被拒绝（限流或排队已满），retry_after 为建议的重试秒数"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充的令牌数，capacity 为突发上限"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self) -> float:
+        """获取一个令牌，成功返回 0，否则返回需要等待的秒数"""
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """按 key（用户/IP）维护令牌桶，空闲的桶按 LRU 淘汰"""
+
+    def __init__(self, rate_per_minute: float, burst: int, max_keys: int = 10000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, key: str) -> float:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.try_acquire()
+
+
+class AdmissionController:
+    """
+    AI 相关接口的准入控制
+    1. 每个 key 的令牌桶限流
+    2. 全局并发上限 + 有界等待队列，排队超过 max_wait 秒则拒绝
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float = 20,
+        burst: int = 10,
+        max_concurrency: int = 4,
+        max_queue: int = 32,
+        max_wait: float = 10.0,
+    ):
+        self.limiter = RateLimiter(rate_per_minute, burst)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.in_flight = 0
+        self.admitted_total = 0
+        self.rejected_total: Dict[str, int] = {
+            "rate_limited": 0,
+            "queue_full": 0,
+            "queue_timeout": 0,
+        }
+        self.wait_times = LatencyTracker(window=1000)
+
+    def _reject(self, reason: str, retry_after: float):
+        self.rejected_total[reason] += 1
+        admission_rejected.inc(reason=reason)
+        raise AdmissionRejected(reason, max(1, math.ceil(retry_after)))
+
+    @asynccontextmanager
+    async def slot(self, key: str):
+        """获取执行槽位，失败时抛出 AdmissionRejected"""
+        # 先检查队列，被拒绝的请求不消耗令牌
+        if self.waiting >= self.max_queue:
+            self._reject("queue_full", self.max_wait)
+
+        retry_after = self.limiter.check(key)
+        if retry_after > 0:
+            self._reject("rate_limited", retry_after)
+
+        self.waiting += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self._reject("queue_timeout", self.max_wait)
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - started
+        self.wait_times.record(waited)
+        admission_wait.observe(waited)
+        self.admitted_total += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.waiting,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted_total": self.admitted_total,
+            "rejected_total": dict(self.rejected_total),
+            "wait_seconds_p50": self.wait_times.percentile(50),
+            "wait_seconds_p95": self.wait_times.percentile(95),
+        }
@@ -1,8 +1,13 @@
 import json
+import logging
 import re
 import os
 from openai import OpenAI
 from typing import Dict, Any, List, Optional
+from observability import get_logger, log_event
+from resilience import CircuitBreaker, ResilientCaller
+
+logger = get_logger("english_study")
 
 # DeepSeek API 配置 - 从环境变量读取
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "")
@@ -12,7 +17,69 @@ if not DEEPSEEK_API_KEY:
     print("WARNING: DEEPSEEK_API_KEY environment variable not set!")
     print("Please set it in backend/.env file or system environment variables")
 
-client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_BASE_URL)
+# 上游调用的超时/重试/熔断/对冲配置
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "20"))
+LLM_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("LLM_ATTEMPT_TIMEOUT_SECONDS", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", "5"))
+LLM_CIRCUIT_RESET_SECONDS = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+
+_client: Optional[OpenAI] = None
+
+
+def get_client() -> OpenAI:
+    """首次调用时再创建客户端，避免拖慢导入和启动"""
+    global _client
+    if _client is None:
+        # 重试由 ResilientCaller 统一负责，关闭 SDK 自带的重试
+        _client = OpenAI(
+            api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_BASE_URL, max_retries=0
+        )
+    return _client
+
+
+llm_caller = ResilientCaller(
+    deadline=LLM_DEADLINE_SECONDS,
+    attempt_timeout=LLM_ATTEMPT_TIMEOUT_SECONDS,
+    max_retries=LLM_MAX_RETRIES,
+    breaker=CircuitBreaker(
+        failure_threshold=LLM_CIRCUIT_FAILURES,
+        recovery_timeout=LLM_CIRCUIT_RESET_SECONDS,
+    ),
+    hedge_enabled=LLM_HEDGE_ENABLED,
+)
+
+
+def _chat_json(system_prompt: str, prompt: str, max_tokens: int) -> Dict[str, Any]:
+    """调用聊天接口并解析 JSON 结果（带超时、重试和熔断）"""
+
+    def request(timeout: float):
+        return get_client().chat.completions.create(
+            model="deepseek-chat",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0.7,
+            max_tokens=max_tokens,
+            timeout=timeout,
+        )
+
+    response = llm_caller.call(request)
+
+    if response.choices and response.choices[0] and response.choices[0].message:
+        result_text = response.choices[0].message.content or ""
+        result_text = result_text.strip()
+        # 提取 JSON（如果被包裹在代码块中）
+        if "```json" in result_text:
+            result_text = result_text.split("```json")[1].split("```")[0].strip()
+        elif "```" in result_text:
+            result_text = result_text.split("```")[1].split("```")[0].strip()
+
+        return json.loads(result_text)
+    else:
+        raise Exception("Invalid response from API")
 
 
 def is_single_word(text: str) -> bool:
@@ -38,33 +105,13 @@ def analyze_word(word: str) -> Dict[str, Any]:
 Keep the response strictly as JSON. Make the definition simple and practical. Focus on tech/business contexts."""
 
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an English learning assistant. Always respond with valid JSON only.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
+        return _chat_json(
+            "You are an English learning assistant. Always respond with valid JSON only.",
+            prompt,
             max_tokens=500,
         )
-
-        if response.choices and response.choices[0] and response.choices[0].message:
-            result_text = response.choices[0].message.content or ""
-            result_text = result_text.strip()
-            # 提取 JSON（如果被包裹在代码块中）
-            if "```json" in result_text:
-                result_text = result_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in result_text:
-                result_text = result_text.split("```")[1].split("```")[0].strip()
-
-            return json.loads(result_text)
-        else:
-            raise Exception("Invalid response from API")
     except Exception as e:
-        print(f"Error analyzing word: {e}")
+        log_event(logger, "analyze_word_failed", level=logging.WARNING, error=str(e))
         # 返回默认结构
         return {
             "word": word,
@@ -72,6 +119,7 @@ Keep the response strictly as JSON. Make the definition simple and practical. Fo
             "definition": f"Definition for {word}",
             "collocations": [],
             "example_sentence": f"Example with {word}.",
+            "degraded": True,
         }
 
 
@@ -91,39 +139,22 @@ Sentence to analyze: "{sentence}"
 Keep the response strictly as JSON. Focus on what makes this sentence useful for learning and how the pattern can be reused."""
 
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an English learning assistant focusing on sentence patterns and expressions. Always respond with valid JSON only.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
+        return _chat_json(
+            "You are an English learning assistant focusing on sentence patterns and expressions. Always respond with valid JSON only.",
+            prompt,
             max_tokens=800,
         )
-
-        if response.choices and response.choices[0] and response.choices[0].message:
-            result_text = response.choices[0].message.content or ""
-            result_text = result_text.strip()
-            # 提取 JSON
-            if "```json" in result_text:
-                result_text = result_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in result_text:
-                result_text = result_text.split("```")[1].split("```")[0].strip()
-
-            return json.loads(result_text)
-        else:
-            raise Exception("Invalid response from API")
     except Exception as e:
-        print(f"Error analyzing sentence: {e}")
+        log_event(
+            logger, "analyze_sentence_failed", level=logging.WARNING, error=str(e)
+        )
         return {
             "sentence": sentence,
             "function": "unknown",
             "pattern": "N/A",
             "why_good": "Analysis failed",
             "rewrite_examples": [],
+            "degraded": True,
         }
 
 
@@ -169,7 +200,8 @@ def analyze_content(
     {
         "entry_type": "word" or "sentence",
         "analysis": {...},
-        "tags": ["tag1", "tag2"]
+        "tags": ["tag1", "tag2"],
+        "degraded": True/False  # AI 调用失败时使用了默认结构，需稍后重新分析
     }
     """
     content = content.strip()
@@ -186,6 +218,8 @@ def analyze_content(
         function = analysis.get("function", "")
         tags = [entry_type, function.split()[0] if function else "expression"]
 
+    degraded = bool(analysis.pop("degraded", False))
+
     # 添加来源作为标签
     if source:
         tags.append((source or "").lower())
@@ -193,4 +227,9 @@ def analyze_content(
     # 清理标签
     tags = [t.strip() for t in tags if t and t.strip()]
 
-    return {"entry_type": entry_type, "analysis": analysis, "tags": tags}
+    return {
+        "entry_type": entry_type,
+        "analysis": analysis,
+        "tags": tags,
+        "degraded": degraded,
+    }
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import bcrypt
+
+# bcrypt 每次耗时约 100ms+，放到独立的有界线程池中执行，避免阻塞事件循环，
+# 也避免登录风暴占满默认线程池
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+_password_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+)
+_password_slots: Optional[asyncio.Semaphore] = None
+
+
+class PasswordHashBusy(Exception):
+    """排队的密码哈希任务过多"""
+
+
+def _slots() -> asyncio.Semaphore:
+    global _password_slots
+    if _password_slots is None:
+        _password_slots = asyncio.Semaphore(PASSWORD_HASH_MAX_PENDING)
+    return _password_slots
+
+
+async def _run_bcrypt(fn, *args):
+    slots = _slots()
+    if slots.locked():
+        raise PasswordHashBusy()
+    async with slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_password_executor, fn, *args)
+
+
+async def hash_password(password: str) -> str:
+    """生成密码哈希"""
+    hashed = await _run_bcrypt(
+        bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt()
+    )
+    return hashed.decode("utf-8")
+
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    """校验密码"""
+    return await _run_bcrypt(
+        bcrypt.checkpw, password.encode("utf-8"), password_hash.encode("utf-8")
+    )
+
+
+class TokenCache:
+    """
+    已验证 token -> 用户 的短期缓存，避免每个请求都解码 JWT 并查询 users 表
+
+    修改密码只会清除处理该请求的 worker 的缓存。为了让其他 worker 也及时拒绝旧 token，
+    命中缓存时会比较 token 的签发时间和用户的修改密码时间（epoch）；epoch 每个用户
+    最多缓存 epoch_ttl 秒，因此旧 token 在其他 worker 上最多还能使用 epoch_ttl 秒
+    """
+
+    def __init__(
+        self, ttl: float = 60.0, max_size: int = 10000, epoch_ttl: float = 5.0
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.epoch_ttl = epoch_ttl
+        # {token: (expires_at, username, user, issued_at)}
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        # {username: (expires_at, 修改密码的时间戳或 None)}
+        self._epochs: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        token: str,
+        load_epoch: Optional[Callable[[str], Optional[float]]] = None,
+    ) -> Optional[Any]:
+        """load_epoch(username) 返回用户修改密码的时间戳，早于它签发的 token 视为失效"""
+        with self._lock:
+            item = self._items.get(token)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._items[token]
+                return None
+        _, username, user, issued_at = item
+        if load_epoch is not None:
+            changed_at = self._epoch(username, load_epoch)
+            if changed_at is not None and issued_at < changed_at:
+                self.invalidate_user(username)
+                return None
+        return user
+
+    def _epoch(
+        self, username: str, load_epoch: Callable[[str], Optional[float]]
+    ) -> Optional[float]:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._epochs.get(username)
+            if cached is not None and cached[0] >= now:
+                return cached[1]
+        changed_at = load_epoch(username)
+        with self._lock:
+            self._epochs[username] = (now + self.epoch_ttl, changed_at)
+            self._epochs.move_to_end(username)
+            while len(self._epochs) > self.max_size:
+                self._epochs.popitem(last=False)
+        return changed_at
+
+    def set(
+        self,
+        token: str,
+        username: str,
+        user: Any,
+        token_exp: float,
+        issued_at: float = 0,
+    ):
+        """token_exp 为 token 的过期时间戳，缓存不会超过它"""
+        ttl = min(self.ttl, token_exp - time.time())
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._items[token] = (time.monotonic() + ttl, username, user, issued_at)
+            self._items.move_to_end(token)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate_user(self, username: str):
+        """修改密码后清除该用户的所有缓存 token"""
+        with self._lock:
+            for token in [t for t, item in self._items.items() if item[1] == username]:
+                del self._items[token]
+            self._epochs.pop(username, None)
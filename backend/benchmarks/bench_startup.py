@@ -0,0 +1,148 @@
+"""
+启动时间基准：测量冷启动时导入 main、存活检查可用、就绪检查通过分别需要多久
+
+用法（在 backend 目录下运行）：
+    python -m benchmarks.bench_startup --sizes 0 10000 100000 --output startup.json
+
+每个规模先在临时目录中准备好数据库和向量，再在全新的子进程中启动应用计时。
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict
+
+from benchmarks.bench_storage import INSERT_CHUNK, git_commit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 在子进程中运行：导入应用并轮询健康检查
+PROBE = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    while client.get("/health/live").status_code != 200:
+        time.sleep(0.005)
+    live = time.perf_counter()
+    while client.get("/health/ready").status_code != 200:
+        time.sleep(0.01)
+    ready = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - started,
+    "live_seconds": live - started,
+    "ready_seconds": ready - started,
+}))
+"""
+
+
+def prepare(workdir: str, size: int, seed: int):
+    """在子进程中写入语料和向量，保证父进程不持有数据库连接"""
+    script = f"""
+import sys
+sys.path.insert(0, {BACKEND_DIR!r})
+sys.path.insert(0, {os.path.dirname(BACKEND_DIR)!r})
+from itertools import islice
+import database
+from ai_service import generate_embedding
+from models import Entry
+from benchmarks.corpus import generate_entries
+database.init_db()
+entries = generate_entries({size}, {seed})
+with database.engine.begin() as conn:
+    while True:
+        chunk = list(islice(entries, {INSERT_CHUNK}))
+        if not chunk:
+            break
+        conn.execute(Entry.__table__.insert(), chunk)
+rows = generate_entries({size}, {seed})
+while True:
+    chunk = list(islice(rows, {INSERT_CHUNK}))
+    if not chunk:
+        break
+    database.vector_db.add_entries(
+        {{"entry_id": r["id"], "content": r["content"],
+          "embedding": generate_embedding(r["content"]),
+          "metadata": {{"entry_type": r["entry_type"], "tags": r["tags"]}},
+          "entry_version": r["version"]}}
+        for r in chunk
+    )
+"""
+    subprocess.run(
+        [sys.executable, "-c", script], cwd=workdir, env=_env(workdir), check=True
+    )
+
+
+def _env(workdir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    env["USE_CLOUD_DB"] = "false"
+    env.setdefault("DEEPSEEK_API_KEY", "benchmark")
+    env["PYTHONPATH"] = BACKEND_DIR
+    return env
+
+
+def run_size(size: int, seed: int, repeat: int) -> Dict:
+    workdir = tempfile.mkdtemp(prefix=f"bench-startup-{size}-")
+    try:
+        started = time.perf_counter()
+        prepare(workdir, size, seed)
+        print(f"[size={size}] prepared in {time.perf_counter() - started:.2f}s")
+
+        runs = []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", PROBE],
+                cwd=workdir,
+                env=_env(workdir),
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+
+        result = {"size": size, "runs": runs}
+        for key in ("import_seconds", "live_seconds", "ready_seconds"):
+            values = sorted(run[key] for run in runs)
+            result[key] = values[len(values) // 2]
+        print(
+            f"  import={result['import_seconds']:.3f}s "
+            f"live={result['live_seconds']:.3f}s ready={result['ready_seconds']:.3f}s"
+        )
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 10000])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="bench_startup.json")
+    args = parser.parse_args()
+
+    results = [run_size(size, args.seed, args.repeat) for size in args.sizes]
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": sys.version.split()[0],
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+存储与搜索热路径的微基准测试
+
+用法（在 backend 目录下运行）：
+    python -m benchmarks.bench_storage --sizes 1000 10000 --output bench.json
+    python -m benchmarks.bench_storage --sizes 1000 --compare bench.json
+
+每个规模都会在临时目录中创建独立的 SQLite 数据库和向量文件，不会影响本地数据。
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Callable, Dict, List
+
+from benchmarks.corpus import generate_entries, sample_queries
+
+INSERT_CHUNK = 10000
+
+
+def measure(fn: Callable[[], object], repeat: int, warmup: int = 1) -> Dict:
+    """多次执行 fn，返回耗时统计（秒）"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        "repeat": repeat,
+        "min": timings[0],
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "p95": timings[min(len(timings) - 1, int(0.95 * len(timings)))],
+        "max": timings[-1],
+    }
+
+
+def git_commit() -> str:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except Exception:
+        return "unknown"
+
+
+def run_size(size: int, seed: int, repeat: int, max_vector_size: int) -> List[Dict]:
+    """在独立的临时目录中对一个语料规模运行全部基准"""
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix=f"bench-{size}-")
+    os.chdir(workdir)
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["USE_CLOUD_DB"] = "false"
+    os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+
+    # 延迟导入：database 在导入时根据环境变量创建引擎和向量库
+    for module in ("database", "models"):
+        sys.modules.pop(module, None)
+    import database
+    from ai_service import generate_embedding
+    from models import Entry, SyncEntry
+
+    database.init_db()
+    results = []
+
+    def record(name: str, stats: Dict, **params):
+        results.append(
+            {"size": size, "benchmark": name, "params": params, "stats": stats}
+        )
+        print(f"  {name:<28} {json.dumps(params):<32} median={stats['median']:.6f}s")
+
+    # 写入语料
+    started = time.perf_counter()
+    entries = generate_entries(size, seed)
+    with database.engine.begin() as conn:
+        while True:
+            chunk = list(islice(entries, INSERT_CHUNK))
+            if not chunk:
+                break
+            conn.execute(Entry.__table__.insert(), chunk)
+    print(f"[size={size}] corpus loaded in {time.perf_counter() - started:.2f}s")
+
+    # 向量库
+    if size <= max_vector_size:
+        vector_db = database.VectorDB()
+        vector_db.add_entries(
+            {
+                "entry_id": row["id"],
+                "content": row["content"],
+                "embedding": generate_embedding(row["content"]),
+                "metadata": {"entry_type": row["entry_type"], "tags": row["tags"]},
+                "entry_version": row["version"],
+            }
+            for row in generate_entries(size, seed)
+        )
+        vector_db.refresh(force=True)
+
+        record("vector_db._load", measure(vector_db._load, repeat))
+
+        next_id = [size + 1]
+
+        def add_one():
+            vector_db.add_entry(
+                next_id[0],
+                f"benchmark entry {next_id[0]}",
+                generate_embedding(f"benchmark entry {next_id[0]}"),
+                {"entry_type": "word", "tags": "vocabulary"},
+            )
+            next_id[0] += 1
+
+        record("vector_db.add_entry", measure(add_one, repeat))
+
+        queries = [generate_embedding(q) for q in sample_queries(repeat)]
+        query_iter = iter(queries * (repeat + 2))
+        for n_results in (5, 50):
+            record(
+                "vector_db.search_similar",
+                measure(
+                    lambda: vector_db.search_similar(next(query_iter), n_results),
+                    repeat,
+                ),
+                n_results=n_results,
+            )
+            query_iter = iter(queries * (repeat + 2))
+    else:
+        print(f"  skipping vector benchmarks (size > {max_vector_size})")
+
+    db = database.SessionLocal()
+    try:
+        # 分页
+        for page in ("first", "middle", "last"):
+            skip = {"first": 0, "middle": size // 2, "last": max(0, size - 100)}[page]
+            record(
+                "get_all_entries",
+                measure(
+                    lambda: database.get_all_entries(db, skip=skip, limit=100), repeat
+                ),
+                page=page,
+                skip=skip,
+                limit=100,
+            )
+
+        # 文本搜索
+        queries = sample_queries(repeat)
+        query_iter = iter(queries * 3)
+        record(
+            "search_entries",
+            measure(lambda: database.search_entries(db, next(query_iter)), repeat),
+        )
+
+        # 同步：上传不同数量的本地修改
+        for upload_size in (0, 10, 100, 1000):
+            upload_size = min(upload_size, size)
+            rows = (
+                db.query(Entry).order_by(Entry.id.desc()).limit(upload_size).all()
+                if upload_size
+                else []
+            )
+            bump = [0]
+
+            def sync_once():
+                bump[0] += 1
+                newer = datetime.utcnow() + timedelta(seconds=bump[0])
+                local_entries = [
+                    SyncEntry(
+                        id=row.id,
+                        content=row.content,
+                        entry_type=row.entry_type,
+                        source=row.source,
+                        note=row.note,
+                        ai_analysis=row.ai_analysis,
+                        tags=row.tags,
+                        created_at=row.created_at,
+                        updated_at=newer,
+                        deleted=0,
+                        device_id=row.device_id,
+                        sync_status="pending",
+                        version=row.version,
+                    )
+                    for row in rows
+                ]
+                database.sync_entries(db, local_entries, "benchmark-device")
+
+            record(
+                "sync_entries",
+                measure(sync_once, max(1, repeat // 4)),
+                upload_size=upload_size,
+            )
+    finally:
+        db.close()
+        database.engine.dispose()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return results
+
+
+def compare(results: List[Dict], baseline_path: str):
+    """与之前保存的结果对比中位数"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    def key(r):
+        return (r["size"], r["benchmark"], json.dumps(r["params"], sort_keys=True))
+
+    old = {key(r): r["stats"]["median"] for r in baseline["results"]}
+    print(f"\nComparison against {baseline_path} ({baseline['meta']['commit']}):")
+    for r in results:
+        previous = old.get(key(r))
+        if previous:
+            ratio = r["stats"]["median"] / previous
+            print(
+                f"  size={r['size']:<8} {r['benchmark']:<28} "
+                f"{json.dumps(r['params']):<32} x{ratio:.2f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Storage and search benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--max-vector-size",
+        type=int,
+        default=100000,
+        help="Skip in-memory vector benchmarks above this corpus size",
+    )
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Previous results JSON to compare with")
+    args = parser.parse_args()
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, backend_dir)
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    commit = git_commit()
+
+    results = []
+    for size in args.sizes:
+        results.extend(run_size(size, args.seed, args.repeat, args.max_vector_size))
+
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
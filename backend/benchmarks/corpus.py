@@ -0,0 +1,122 @@
+"""
+确定性的合成语料生成器
+相同的 seed 和 size 总是生成相同的条目（单词 + 句子，带真实结构的 ai_analysis）
+"""
+
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+PARTS_OF_SPEECH = ["noun", "verb", "adjective", "adverb", "preposition"]
+FUNCTIONS = [
+    "emphasizing a key point",
+    "contrasting two ideas",
+    "explaining a cause",
+    "expressing an opinion",
+    "summarizing a result",
+]
+SOURCES = ["article", "podcast", "meeting", "book", "video", ""]
+SYLLABLES = [
+    "ex",
+    "pan",
+    "sion",
+    "lev",
+    "er",
+    "age",
+    "sys",
+    "tem",
+    "ic",
+    "re",
+    "sil",
+    "ient",
+    "cap",
+    "ital",
+    "ize",
+    "trans",
+    "form",
+    "ation",
+    "met",
+    "ric",
+]
+SENTENCE_TEMPLATES = [
+    "The {a} of the {b} depends on how we {c} the {d}.",
+    "Not only does the {a} improve, but the {b} also becomes more {c}.",
+    "What really matters here is the {a}, not the {b}.",
+    "If we {c} the {a} early, the {b} will follow naturally.",
+    "Despite the {a}, the team managed to {c} the {d}.",
+]
+
+BASE_TIME = datetime(2025, 1, 1)
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def _word_analysis(rng: random.Random, word: str) -> Dict:
+    return {
+        "word": word,
+        "part_of_speech": rng.choice(PARTS_OF_SPEECH),
+        "definition": f"To {_word(rng)} something in a {_word(rng)} way",
+        "collocations": [f"{_word(rng)} {word}" for _ in range(3)],
+        "example_sentence": f"We need to {word} the {_word(rng)} before launch.",
+    }
+
+
+def _sentence_analysis(rng: random.Random, sentence: str) -> Dict:
+    return {
+        "sentence": sentence,
+        "function": rng.choice(FUNCTIONS),
+        "pattern": f"{_word(rng)} + {_word(rng)} + clause",
+        "why_good": "It is concise and the structure can be reused in reports.",
+        "rewrite_examples": [
+            f"The {_word(rng)} shapes the {_word(rng)}.",
+            f"Our {_word(rng)} drives the {_word(rng)}.",
+        ],
+    }
+
+
+def generate_entries(size: int, seed: int = 42) -> Iterator[Dict]:
+    """生成 size 条条目（约 60% 单词，40% 句子），按创建时间递增"""
+    rng = random.Random(seed)
+    for i in range(size):
+        created_at = BASE_TIME + timedelta(minutes=i)
+        source = rng.choice(SOURCES)
+        if rng.random() < 0.6:
+            content = _word(rng)
+            entry_type = "word"
+            analysis = _word_analysis(rng, content)
+            tags = [analysis["part_of_speech"], "vocabulary"]
+        else:
+            template = rng.choice(SENTENCE_TEMPLATES)
+            content = template.format(
+                a=_word(rng), b=_word(rng), c=_word(rng), d=_word(rng)
+            )
+            entry_type = "sentence"
+            analysis = _sentence_analysis(rng, content)
+            tags = ["sentence", analysis["function"].split()[0]]
+        if source:
+            tags.append(source)
+        yield {
+            "id": i + 1,
+            "content": content,
+            "entry_type": entry_type,
+            "source": source,
+            "note": "",
+            "ai_analysis": json.dumps(analysis, ensure_ascii=False),
+            "tags": ",".join(tags),
+            "created_at": created_at,
+            "updated_at": created_at,
+            "deleted": 0,
+            "device_id": f"device-{rng.randint(1, 5)}",
+            "sync_status": "synced",
+            "version": 1,
+        }
+
+
+def sample_queries(count: int, seed: int = 7) -> List[str]:
+    """用于文本搜索的查询词"""
+    rng = random.Random(seed)
+    queries = [rng.choice(SYLLABLES) + rng.choice(SYLLABLES) for _ in range(count)]
+    return queries + ["vocabulary", "article"]
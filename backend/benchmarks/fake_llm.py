@@ -0,0 +1,131 @@
+"""
+本地的 OpenAI 兼容假 LLM 服务，用于压测和故障演练
+
+用法（在 backend 目录下运行）：
+    python -m benchmarks.fake_llm --port 9100 --latency lognormal:0.8,0.5 --error-rate 0.02
+
+然后以 DEEPSEEK_BASE_URL=http://127.0.0.1:9100 启动后端。
+
+延迟分布：
+    fixed:0.5              固定 0.5 秒
+    uniform:0.2,1.5        0.2~1.5 秒均匀分布
+    lognormal:0.8,0.5      中位数 0.8 秒、sigma 0.5 的对数正态分布（长尾）
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def parse_latency(spec: str):
+    """把延迟分布描述解析为一个返回秒数的函数"""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def fake_analysis(prompt: str) -> dict:
+    """根据提示词生成结构正确的分析结果"""
+    word = re.search(r'Analyze the English word "([^"]*)"', prompt)
+    if word:
+        text = word.group(1)
+        return {
+            "word": text,
+            "part_of_speech": random.choice(["noun", "verb", "adjective"]),
+            "definition": f"A fake definition of {text}",
+            "collocations": [f"{text} strategy", f"key {text}", f"{text} plan"],
+            "example_sentence": f"We should {text} the roadmap this quarter.",
+        }
+    sentence = re.search(r'Sentence to analyze: "([^"]*)"', prompt)
+    text = sentence.group(1) if sentence else ""
+    return {
+        "sentence": text,
+        "function": random.choice(["emphasizing", "contrasting", "explaining"]),
+        "pattern": "subject + verb + object",
+        "why_good": "Fake analysis for load testing.",
+        "rewrite_examples": [f"Rewrite of: {text}"],
+    }
+
+
+def create_app(latency_spec: str, error_rate: float, hang_rate: float) -> FastAPI:
+    app = FastAPI(title="Fake LLM")
+    sample_latency = parse_latency(latency_spec)
+    stats = {"requests": 0, "errors": 0, "hangs": 0}
+
+    async def chat_completions(request: Request):
+        stats["requests"] += 1
+        body = await request.json()
+
+        roll = random.random()
+        if roll < hang_rate:
+            # 模拟上游卡死，直到客户端超时
+            stats["hangs"] += 1
+            await asyncio.sleep(3600)
+        await asyncio.sleep(sample_latency())
+        if roll < hang_rate + error_rate:
+            stats["errors"] += 1
+            return JSONResponse(
+                status_code=random.choice([429, 500, 503]),
+                content={"error": {"message": "injected failure"}},
+            )
+
+        prompt = body["messages"][-1]["content"]
+        content = json.dumps(fake_analysis(prompt))
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "deepseek-chat"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    # 同时支持 base_url 带或不带 /v1
+    app.post("/chat/completions")(chat_completions)
+    app.post("/v1/chat/completions")(chat_completions)
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", default="lognormal:0.8,0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    app = create_app(args.latency, args.error_rate, args.hang_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
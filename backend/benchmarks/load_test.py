@@ -0,0 +1,267 @@
+"""
+端到端压测：按真实比例混合 create/list/similar/sync/login 请求
+
+用法（在 backend 目录下运行）：
+    # 1. 启动假 LLM
+    python -m benchmarks.fake_llm --port 9100
+    # 2. 以假 LLM 启动后端
+    DEEPSEEK_API_KEY=fake DEEPSEEK_BASE_URL=http://127.0.0.1:9100 uvicorn main:app --port 8000
+    # 3. 逐级增加并发用户数
+    python -m benchmarks.load_test --base-url http://127.0.0.1:8000 --users 5 10 25 50 --duration 30
+
+每个并发级别分别输出各接口的吞吐量和 p50/p95/p99 延迟，--output 可保存为 JSON。
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.corpus import generate_entries
+
+DEFAULT_MIX = {"list": 40, "similar": 25, "create": 10, "sync": 15, "login": 10}
+PASSWORD = "load-test-password"
+
+
+def percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint: str, latency: float, status: str):
+        self.latencies[endpoint].append(latency)
+        self.statuses[endpoint][status] += 1
+
+    def summary(self, elapsed: float) -> Dict:
+        report = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            ordered = sorted(values)
+            statuses = dict(self.statuses[endpoint])
+            errors = sum(
+                count
+                for code, count in statuses.items()
+                if not code.startswith("2") and code != "429"
+            )
+            report[endpoint] = {
+                "requests": len(ordered),
+                "throughput_rps": len(ordered) / elapsed if elapsed else 0.0,
+                "errors": errors,
+                "rejected_429": statuses.get("429", 0),
+                "p50": percentile(ordered, 50),
+                "p95": percentile(ordered, 95),
+                "p99": percentile(ordered, 99),
+                "max": ordered[-1] if ordered else 0.0,
+                "statuses": statuses,
+            }
+        return report
+
+
+class VirtualUser:
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        recorder: Recorder,
+        mix: Dict[str, int],
+        corpus: List[Dict],
+        think_time: float,
+    ):
+        self.client = client
+        self.recorder = recorder
+        self.actions = list(mix.keys())
+        self.weights = list(mix.values())
+        self.corpus = corpus
+        # 条目按用户隔离，只能查询自己创建的条目
+        self.entry_ids: List[int] = []
+        self.think_time = think_time
+        self.username = f"load-{uuid.uuid4().hex[:10]}"
+        self.device_id = f"load-device-{uuid.uuid4().hex[:8]}"
+        self.headers = {"X-Device-ID": self.device_id}
+
+    async def request(self, endpoint: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(
+                method, url, headers=self.headers, **kwargs
+            )
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            response = None
+            status = type(e).__name__
+        self.recorder.record(endpoint, time.perf_counter() - started, status)
+        return response
+
+    async def setup(self):
+        response = await self.request(
+            "register",
+            "POST",
+            "/auth/register",
+            json={"username": self.username, "password": PASSWORD},
+        )
+        if response is not None and response.status_code == 200:
+            token = response.json()["access_token"]
+            self.headers["Authorization"] = f"Bearer {token}"
+
+    async def run(self, deadline: float):
+        while time.perf_counter() < deadline:
+            action = random.choices(self.actions, self.weights)[0]
+            await getattr(self, f"do_{action}")()
+            if self.think_time:
+                await asyncio.sleep(random.expovariate(1.0 / self.think_time))
+
+    async def do_create(self):
+        item = random.choice(self.corpus)
+        response = await self.request(
+            "create",
+            "POST",
+            "/entries",
+            json={"content": item["content"], "source": item["source"]},
+        )
+        if response is not None and response.status_code == 200:
+            self.entry_ids.append(response.json()["id"])
+
+    async def do_list(self):
+        await self.request("list", "GET", "/entries", params={"limit": 50})
+
+    async def do_similar(self):
+        if not self.entry_ids:
+            # 还没有自己的条目，先创建一个
+            return await self.do_create()
+        entry_id = random.choice(self.entry_ids)
+        await self.request("similar", "GET", f"/entries/{entry_id}/similar")
+
+    async def do_sync(self):
+        await self.request(
+            "sync",
+            "POST",
+            "/sync",
+            json={"device_id": self.device_id, "local_entries": []},
+        )
+
+    async def do_login(self):
+        await self.request(
+            "login",
+            "POST",
+            "/auth/login",
+            json={"username": self.username, "password": PASSWORD},
+        )
+
+
+async def run_stage(
+    base_url: str,
+    users: int,
+    duration: float,
+    mix: Dict[str, int],
+    corpus: List[Dict],
+    think_time: float,
+    timeout: float,
+) -> Dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=users * 2)
+    async with httpx.AsyncClient(
+        base_url=base_url, timeout=timeout, limits=limits
+    ) as client:
+        vusers = [
+            VirtualUser(client, recorder, mix, corpus, think_time) for _ in range(users)
+        ]
+        await asyncio.gather(*(vuser.setup() for vuser in vusers))
+
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(vuser.run(deadline) for vuser in vusers))
+        elapsed = time.perf_counter() - started
+
+    endpoints = recorder.summary(elapsed)
+    endpoints.pop("register", None)
+    total = sum(e["requests"] for e in endpoints.values())
+    return {
+        "users": users,
+        "duration": elapsed,
+        "total_requests": total,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def print_stage(stage: Dict):
+    print(
+        f"\n=== {stage['users']} users: {stage['total_requests']} requests, "
+        f"{stage['throughput_rps']:.1f} req/s ==="
+    )
+    print(
+        f"  {'endpoint':<10}{'req':>8}{'rps':>9}{'err':>6}{'429':>6}"
+        f"{'p50':>9}{'p95':>9}{'p99':>9}"
+    )
+    for name, e in stage["endpoints"].items():
+        print(
+            f"  {name:<10}{e['requests']:>8}{e['throughput_rps']:>9.1f}"
+            f"{e['errors']:>6}{e['rejected_429']:>6}"
+            f"{e['p50'] * 1000:>7.0f}ms{e['p95'] * 1000:>7.0f}ms"
+            f"{e['p99'] * 1000:>7.0f}ms"
+        )
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    """解析 "list=40,create=10" 形式的请求比例"""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown action: {name}")
+        mix[name] = int(weight)
+    return mix
+
+
+async def main_async(args):
+    mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+    corpus = list(generate_entries(2000, seed=args.seed))
+    random.seed(args.seed)
+
+    stages = []
+    for users in args.users:
+        stage = await run_stage(
+            args.base_url,
+            users,
+            args.duration,
+            mix,
+            corpus,
+            args.think_time,
+            args.timeout,
+        )
+        print_stage(stage)
+        stages.append(stage)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"mix": mix, "stages": stages}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, nargs="+", default=[5, 10, 25])
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--think-time", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--mix", help='e.g. "list=40,similar=25,create=10"')
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
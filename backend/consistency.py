@@ -0,0 +1,263 @@
+"""
+entries 表与向量存储的一致性检查和修复
+
+按 entry_id 分批流式对比两边的数据，找出：
+- missing: 条目存在但没有向量
+- orphaned: 向量存在但条目已删除（或软删除）
+- stale: 向量对应的 version / 用户 / 内容与条目不一致
+
+修复时在进程池中并行生成 embedding，同时按批次写入向量（每批一个短事务），
+可以在服务运行期间执行而不阻塞请求：
+- 只检查开始时已存在的条目（id 不超过当时的最大值），扫描期间新建的条目由请求自己写入向量
+- 每次写入/删除都在同一事务中重新检查条目，扫描之后被修改或删除的条目不会被覆盖
+
+用法（在 backend 目录下运行）：
+    python consistency.py              # 只检查
+    python consistency.py --repair     # 检查并修复
+"""
+
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select
+
+from ai_service import generate_embedding
+from database import engine, vector_db
+from models import Entry, EntryVector
+
+
+def _embed_batch(contents: List[str]) -> List[List[float]]:
+    """在子进程中生成一批 embedding"""
+    return [generate_embedding(content) for content in contents]
+
+
+class ConsistencyChecker:
+    def __init__(
+        self,
+        batch_size: int = 1000,
+        workers: Optional[int] = None,
+        repair: bool = False,
+    ):
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.repair = repair
+        self.report = {
+            "status": "pending",
+            "repair": repair,
+            "started_at": None,
+            "finished_at": None,
+            "entries_scanned": 0,
+            "vectors_scanned": 0,
+            "missing": 0,
+            "orphaned": 0,
+            "stale": 0,
+            "rebuilt": 0,
+            "removed": 0,
+            # 扫描之后条目已被修改或删除，跳过修复
+            "changed_during_scan": 0,
+            "error": None,
+        }
+
+    def _entry_batches(self, max_id: int):
+        """按 id 顺序流式读取 id 不超过 max_id 的条目"""
+        last_id = 0
+        while True:
+            with engine.connect() as conn:
+                rows = conn.execute(
+                    select(
+                        Entry.id,
+                        Entry.content,
+                        Entry.entry_type,
+                        Entry.tags,
+                        Entry.version,
+                        Entry.user_id,
+                        Entry.deleted,
+                    )
+                    .where(Entry.id > last_id, Entry.id <= max_id)
+                    .order_by(Entry.id)
+                    .limit(self.batch_size)
+                ).all()
+            if not rows:
+                return
+            yield last_id, rows
+            last_id = rows[-1].id
+
+    @staticmethod
+    def _vectors_between(low: int, high: Optional[int]) -> Dict[int, object]:
+        """读取 (low, high] 范围内的有效向量，high 为 None 表示不设上限"""
+        query = select(
+            EntryVector.entry_id,
+            EntryVector.content,
+            EntryVector.user_id,
+            EntryVector.entry_version,
+        ).where(EntryVector.deleted == 0, EntryVector.entry_id > low)
+        if high is not None:
+            query = query.where(EntryVector.entry_id <= high)
+        with engine.connect() as conn:
+            return {row.entry_id: row for row in conn.execute(query)}
+
+    @staticmethod
+    def _is_stale(entry, vector) -> bool:
+        if vector.user_id != entry.user_id:
+            return True
+        if vector.entry_version is not None:
+            return vector.entry_version != entry.version
+        # 旧数据没有记录 version，退回到比较内容
+        return vector.content != entry.content
+
+    def _diff(self, low: int, entries) -> tuple:
+        """返回 (需要重建的条目, 需要删除的向量 id)"""
+        vectors = self._vectors_between(low, entries[-1].id)
+        self.report["vectors_scanned"] += len(vectors)
+        rebuild, remove = [], []
+        for entry in entries:
+            vector = vectors.pop(entry.id, None)
+            if entry.deleted:
+                if vector is not None:
+                    self.report["orphaned"] += 1
+                    remove.append(entry.id)
+            elif vector is None:
+                self.report["missing"] += 1
+                rebuild.append(entry)
+            elif self._is_stale(entry, vector):
+                self.report["stale"] += 1
+                rebuild.append(entry)
+        # 范围内剩下的向量没有对应的条目
+        self.report["orphaned"] += len(vectors)
+        remove.extend(vectors.keys())
+        return rebuild, remove
+
+    def _write(self, entries, embeddings):
+        written = vector_db.add_entries(
+            (
+                {
+                    "entry_id": entry.id,
+                    "content": entry.content,
+                    "embedding": embedding,
+                    "metadata": {"entry_type": entry.entry_type, "tags": entry.tags},
+                    "user_id": entry.user_id,
+                    "entry_version": entry.version,
+                }
+                for entry, embedding in zip(entries, embeddings)
+            ),
+            only_current=True,
+        )
+        self.report["rebuilt"] += len(written)
+        self.report["changed_during_scan"] += len(entries) - len(written)
+
+    def _remove(self, entry_ids):
+        entry_ids = list(entry_ids)
+        removed = vector_db.delete_entries(entry_ids, only_orphaned=True)
+        self.report["removed"] += len(removed)
+        self.report["changed_during_scan"] += len(entry_ids) - len(removed)
+
+    def run(self) -> dict:
+        self.report["status"] = "running"
+        self.report["started_at"] = datetime.utcnow()
+        executor = (
+            ProcessPoolExecutor(max_workers=self.workers) if self.repair else None
+        )
+        # 上一批的 embedding 任务，写入与下一批的计算重叠进行
+        pending = None
+        last_id = 0
+        try:
+            # 之后新建的条目不在检查范围内，否则它们的向量会被当作孤儿删除
+            with engine.connect() as conn:
+                max_id = conn.execute(select(func.max(Entry.id))).scalar() or 0
+            for low, entries in self._entry_batches(max_id):
+                self.report["entries_scanned"] += len(entries)
+                last_id = entries[-1].id
+                rebuild, remove = self._diff(low, entries)
+                if not self.repair:
+                    continue
+
+                if remove:
+                    self._remove(remove)
+                if rebuild:
+                    chunk = max(1, len(rebuild) // self.workers)
+                    futures = [
+                        executor.submit(
+                            _embed_batch, [e.content for e in rebuild[i : i + chunk]]
+                        )
+                        for i in range(0, len(rebuild), chunk)
+                    ]
+                    if pending is not None:
+                        self._write(*self._collect(pending))
+                    pending = (rebuild, futures)
+
+            if pending is not None:
+                self._write(*self._collect(pending))
+
+            # 最后一批之后、开始时最大 id 之前的向量没有对应的条目
+            tail = self._vectors_between(last_id, max_id)
+            self.report["vectors_scanned"] += len(tail)
+            self.report["orphaned"] += len(tail)
+            if self.repair and tail:
+                self._remove(tail.keys())
+
+            self.report["status"] = "finished"
+        except Exception as e:
+            self.report["status"] = "failed"
+            self.report["error"] = str(e)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            self.report["finished_at"] = datetime.utcnow()
+        return self.report
+
+    @staticmethod
+    def _collect(pending) -> tuple:
+        entries, futures = pending
+        embeddings = []
+        for future in futures:
+            embeddings.extend(future.result())
+        return entries, embeddings
+
+
+class ConsistencyJob:
+    """在后台线程中运行检查，同一时间只允许一个任务"""
+
+    def __init__(self):
+        self.checker: Optional[ConsistencyChecker] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self, repair: bool, workers: Optional[int] = None) -> bool:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self.checker = ConsistencyChecker(repair=repair, workers=workers)
+            self._thread = threading.Thread(
+                target=self.checker.run, name="consistency-check", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def status(self) -> Optional[dict]:
+        return self.checker.report if self.checker else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and repair the vector store")
+    parser.add_argument("--repair", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    checker = ConsistencyChecker(
+        batch_size=args.batch_size, workers=args.workers, repair=args.repair
+    )
+    report = checker.run()
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    print(f"elapsed: {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
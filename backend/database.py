@@ -1,15 +1,46 @@
-from sqlalchemy import create_engine
+from sqlalchemy import (
+    bindparam,
+    create_engine,
+    delete,
+    exists,
+    func,
+    insert,
+    inspect,
+    or_,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, Session
-from models import Base, Entry, SyncEntry
+from models import (
+    Base,
+    Entry,
+    EntryVector,
+    SyncEntry,
+    EntryNeighbor,
+    User,
+    UserDailyStats,
+    VectorStoreMeta,
+)
 import numpy as np
 import json
+import logging
 import os
-from datetime import datetime
+import string
+import threading
+import time
+from datetime import datetime, timedelta
 import uuid
-from typing import List, Optional
+from types import MappingProxyType
+from typing import Iterable, List, Mapping, Optional, Tuple
 from dotenv import load_dotenv
+from review import PASS_GRADE, next_schedule
+from stats import StatsDelta, reassign_stats, recompute_stats
+from observability import get_logger, log_event
 
 load_dotenv()
+logger = get_logger("english_study")
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./english_study.db")
 USE_CLOUD_DB = os.getenv("USE_CLOUD_DB", "false").lower() == "true"
@@ -35,10 +66,220 @@ def get_device_id() -> str:
 
 
 def init_db():
+    stats_missing = not inspect(engine).has_table(UserDailyStats.__tablename__)
     Base.metadata.create_all(bind=engine)
+    vector_db.seed_generation()
+    _add_missing_columns()
+    _add_missing_indexes()
+    _backfill_review_schedule()
+    _backfill_analysis_fields()
+    _normalize_sentence_functions()
+    if stats_missing:
+        # 统计表是新建的，从已有条目初始化
+        with engine.begin() as conn:
+            recompute_stats(conn)
+    _claim_legacy_for_single_user()
+
+
+def _claim_legacy_for_single_user():
+    """
+    按用户隔离之前创建的条目 user_id 都为空。只有一个用户时它们必然属于该用户，
+    启动时自动认领；多个用户时需要管理员通过 /admin/claim-legacy 指定
+    """
+    with engine.connect() as conn:
+        user_ids = conn.execute(select(User.id).limit(2)).scalars().all()
+    if len(user_ids) == 1:
+        claimed = claim_legacy_entries(user_ids[0])
+        if claimed:
+            log_event(
+                logger, "legacy_entries_claimed", user_id=user_ids[0], count=claimed
+            )
+
+
+def claim_legacy_entries(user_id: int) -> int:
+    """把未归属任何用户的条目（及其向量、统计、相似条目）转给指定用户，返回条目数"""
+    with engine.begin() as conn:
+        claimed = conn.execute(
+            update(Entry)
+            .where(Entry.user_id.is_(None))
+            .values(user_id=user_id, updated_at=Entry.updated_at)
+        ).rowcount
+        if not claimed:
+            return 0
+        reassign_stats(conn, None, user_id)
+        # 两个分区合并后原有的相似条目不再完整，交给后台任务重算
+        conn.execute(
+            delete(EntryNeighbor).where(
+                EntryNeighbor.user_id.is_(None) | (EntryNeighbor.user_id == user_id)
+            )
+        )
+    vector_db.reassign_owner(None, user_id)
+    return claimed
+
+
+def _add_missing_columns():
+    """为已存在的表补充模型中新增的列（create_all 不会修改已有的表）"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                default = column.default
+                if default is not None and default.is_scalar:
+                    value = default.arg
+                    if isinstance(value, str):
+                        ddl += f" DEFAULT '{value}'"
+                    else:
+                        ddl += f" DEFAULT {value}"
+                conn.execute(text(ddl))
+
+
+def _add_missing_indexes():
+    """为已存在的表补充模型中新增的索引"""
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
 
 
 # 获取数据库会话
+def _backfill_review_schedule():
+    """旧条目没有复习时间，按创建时间视为已到期"""
+    with engine.begin() as conn:
+        conn.execute(
+            update(Entry)
+            .where(Entry.due_at.is_(None))
+            .values(
+                due_at=func.coalesce(Entry.created_at, func.current_timestamp()),
+                # 不触发 onupdate，避免所有条目都被视为有更新而重新同步
+                updated_at=Entry.updated_at,
+            )
+        )
+
+
+def _truncate(value, max_length: Optional[int] = None) -> Optional[str]:
+    if not isinstance(value, str) or not value.strip():
+        return None
+    value = value.strip()
+    return value[:max_length] if max_length else value
+
+
+def function_category(value) -> Optional[str]:
+    """
+    AI 返回的 function 是自由文本（如 "expressing opinion about ..."），
+    取第一个词作为类别（与自动生成的标签一致），按类别精确匹配筛选
+    """
+    value = _truncate(value)
+    if value is None:
+        return None
+    category = value.split()[0].strip(string.punctuation).lower()
+    return category[:50] or None
+
+
+def analysis_fields(ai_analysis) -> dict:
+    """从 ai_analysis（JSON 字符串或字典）中提取结构化字段"""
+    data = ai_analysis
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            data = None
+    if not isinstance(data, dict):
+        data = {}
+    part_of_speech = _truncate(data.get("part_of_speech"), 30)
+    return {
+        "part_of_speech": part_of_speech.lower() if part_of_speech else None,
+        "definition": _truncate(data.get("definition")),
+        "sentence_function": function_category(data.get("function")),
+        "sentence_pattern": _truncate(data.get("pattern")),
+    }
+
+
+def _set_analysis(entry: Entry, ai_analysis: str):
+    entry.ai_analysis = ai_analysis
+    for key, value in analysis_fields(ai_analysis).items():
+        setattr(entry, key, value)
+
+
+def _backfill_analysis_fields(batch_size: int = 1000):
+    """为还没有结构化字段的旧条目解析 ai_analysis，按 id 分批提交"""
+    statement = (
+        update(Entry)
+        .where(Entry.id == bindparam("entry_id"))
+        .values(
+            part_of_speech=bindparam("part_of_speech"),
+            definition=bindparam("definition"),
+            sentence_function=bindparam("sentence_function"),
+            sentence_pattern=bindparam("sentence_pattern"),
+            updated_at=Entry.updated_at,
+        )
+    )
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(Entry.id, Entry.ai_analysis)
+                .where(
+                    Entry.id > last_id,
+                    Entry.part_of_speech.is_(None),
+                    Entry.sentence_function.is_(None),
+                    Entry.ai_analysis.is_not(None),
+                )
+                .order_by(Entry.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return
+            last_id = rows[-1].id
+            params = []
+            for row in rows:
+                fields = analysis_fields(row.ai_analysis)
+                if any(fields.values()):
+                    params.append({"entry_id": row.id, **fields})
+            if params:
+                conn.execute(statement, params)
+
+
+def _normalize_sentence_functions(batch_size: int = 1000):
+    """把早期保存的整段 function 文本改为类别（第一个词）"""
+    statement = (
+        update(Entry)
+        .where(Entry.id == bindparam("entry_id"))
+        .values(sentence_function=bindparam("category"), updated_at=Entry.updated_at)
+    )
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(Entry.id, Entry.sentence_function)
+                .where(
+                    Entry.id > last_id,
+                    or_(*(Entry.sentence_function.like(f"%{c}%") for c in " ,.;:")),
+                )
+                .order_by(Entry.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return
+            last_id = rows[-1].id
+            conn.execute(
+                statement,
+                [
+                    {
+                        "entry_id": row.id,
+                        "category": function_category(row.sentence_function),
+                    }
+                    for row in rows
+                ],
+            )
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -47,86 +288,462 @@ def get_db():
         db.close()
 
 
-# 简化的向量数据库（内存存储 + JSON 持久化）
+# 向量数据库（SQL 表持久化 + 进程内 numpy 索引）
+# 多个 worker 进程共享 entry_vectors 表，每次写入递增全局 generation，
+# 各 worker 读取前比较 generation，只增量拉取变化的行。
 class VectorDB:
-    def __init__(self):
-        # 创建持久化目录
-        self.persist_directory = "./vector_db"
-        os.makedirs(self.persist_directory, exist_ok=True)
-        self.data_file = os.path.join(self.persist_directory, "vectors.json")
+    def __init__(self, bind=None, refresh_interval: float = None):
+        self.engine = bind if bind is not None else engine
+        # 两次检查 generation 的最小间隔（秒），避免每次搜索都查询
+        self.refresh_interval = (
+            refresh_interval
+            if refresh_interval is not None
+            else float(os.getenv("VECTOR_REFRESH_INTERVAL", "0.5"))
+        )
+        self.legacy_file = os.path.join("./vector_db", "vectors.json")
 
-        # 内存存储：{entry_id: {"embedding": [...], "content": "...", "metadata": {...}}}
-        self.vectors = {}
+        # 按用户分区的内存索引：
+        # {user_id: {entry_id: {"embedding": np.ndarray, "content": "...", "metadata": {...}}}}
+        # user_id 为 None 的分区保存未登录时创建的条目
+        self.partitions = {}
+        self._owner = {}  # {entry_id: user_id}
+        self._matrices = {}  # {user_id: (ids, 归一化后的向量矩阵)}
+        self.generation = 0
+        self._checked_at = 0.0
+        self._loaded = False
+        self._lock = threading.RLock()
+        # 预热进度，供 /health/ready 展示
+        self.load_progress = {"loaded": 0, "total": None}
+        # 向量变化后的回调 callback(event, entry_ids)，event 为 "added" 或 "deleted"
+        self._listeners = []
+        # 本进程写入的 generation，refresh 时据此区分其他进程写入的变化
+        self._own_generations = set()
+        # 其他进程写入、本进程的回调没有收到的条目 id（有回调时才记录）
+        self._external_changes = set()
 
-        # 从文件加载
-        self._load()
+    def add_listener(self, callback):
+        self._listeners.append(callback)
 
-    def _load(self):
-        """从文件加载向量数据"""
-        if os.path.exists(self.data_file):
+    def _notify(self, event: str, entry_ids: List[int]):
+        for callback in self._listeners:
             try:
-                with open(self.data_file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    # 转换回整数键
-                    self.vectors = {int(k): v for k, v in data.items()}
+                callback(event, entry_ids)
             except Exception as e:
-                print(f"Error loading vector data: {e}")
-                self.vectors = {}
+                log_event(
+                    logger,
+                    "vector_listener_failed",
+                    level=logging.ERROR,
+                    event_type=event,
+                    error=str(e),
+                )
 
-    def _save(self):
-        """保存向量数据到文件"""
+    def take_external_changes(self) -> set:
+        """取出并清空其他进程写入的条目 id"""
+        with self._lock:
+            changes, self._external_changes = self._external_changes, set()
+        return changes
+
+    @property
+    def is_ready(self) -> bool:
+        return self._loaded
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.warm_up()
+
+    def warm_up(self, batch_size: int = 5000):
+        """加载全部向量并建立索引（启动后在后台线程中调用）"""
+        with self._lock:
+            if self._loaded:
+                return
+            self._ensure_tables()
+            self._import_legacy_file()
+            self._load(batch_size)
+            self._loaded = True
+        # 拉取加载期间其他请求写入的变化
+        self.refresh(force=True)
+
+    def _import_legacy_file(self):
+        """把旧版 vectors.json 导入到 entry_vectors 表（只在表为空时执行一次）"""
+        if not os.path.exists(self.legacy_file):
+            return
+        with self.engine.begin() as conn:
+            if conn.execute(select(func.count()).select_from(EntryVector)).scalar():
+                return
         try:
-            with open(self.data_file, "w", encoding="utf-8") as f:
-                json.dump(self.vectors, f, ensure_ascii=False, indent=2)
+            with open(self.legacy_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
         except Exception as e:
-            print(f"Error saving vector data: {e}")
-
-    def add_entry(self, entry_id: int, content: str, embedding: list, metadata: dict):
-        """添加条目到向量数据库"""
-        self.vectors[entry_id] = {
-            "embedding": embedding,
-            "content": content,
-            "metadata": metadata,
+            log_event(
+                logger,
+                "legacy_vectors_load_failed",
+                level=logging.ERROR,
+                path=self.legacy_file,
+                error=str(e),
+            )
+            return
+        self.add_entries(
+            {
+                "entry_id": int(k),
+                "content": v["content"],
+                "embedding": v["embedding"],
+                "metadata": v.get("metadata", {}),
+            }
+            for k, v in data.items()
+        )
+        try:
+            os.replace(self.legacy_file, self.legacy_file + ".migrated")
+        except FileNotFoundError:
+            # 另一个 worker 已经完成了迁移
+            pass
+        log_event(
+            logger, "legacy_vectors_imported", count=len(data), path=self.legacy_file
+        )
+
+    def _load(self, batch_size: int = 5000):
+        """按 entry_id 分批从数据库完整加载向量数据"""
+        with self._lock:
+            with self.engine.connect() as conn:
+                # 先记录 generation，加载期间的写入会在之后的 refresh 中补上
+                generation = self._current_generation(conn)
+                total = conn.execute(
+                    select(func.count())
+                    .select_from(EntryVector)
+                    .where(EntryVector.deleted == 0)
+                ).scalar()
+            self.load_progress = {"loaded": 0, "total": total}
+            self.partitions = {}
+            self._owner = {}
+            self._matrices = {}
+
+            last_id = 0
+            while True:
+                with self.engine.connect() as conn:
+                    rows = conn.execute(
+                        select(EntryVector)
+                        .where(EntryVector.deleted == 0, EntryVector.entry_id > last_id)
+                        .order_by(EntryVector.entry_id)
+                        .limit(batch_size)
+                    ).all()
+                if not rows:
+                    break
+                for row in rows:
+                    self._apply_row(row)
+                last_id = rows[-1].entry_id
+                self.load_progress["loaded"] += len(rows)
+
+            self.generation = generation
+            self._checked_at = time.monotonic()
+
+    @staticmethod
+    def _current_generation(conn) -> int:
+        generation = conn.execute(
+            select(VectorStoreMeta.generation).where(VectorStoreMeta.id == 1)
+        ).scalar()
+        return generation or 0
+
+    @staticmethod
+    def _row_to_item(row) -> dict:
+        return {
+            "embedding": np.frombuffer(row.embedding, dtype=np.float32),
+            "content": row.content,
+            "metadata": json.loads(row.metadata_json or "{}"),
         }
-        self._save()
 
-    def search_similar(self, embedding: list, n_results: int = 5):
-        """搜索相似条目（使用余弦相似度）"""
-        if not self.vectors:
-            return {"ids": [[]], "distances": [[]]}
+    def _apply_row(self, row):
+        """把一行变化应用到内存分区，并使受影响分区的矩阵失效"""
+        previous_owner = self._owner.pop(row.entry_id, "missing")
+        if previous_owner != "missing":
+            self.partitions.get(previous_owner, {}).pop(row.entry_id, None)
+            self._matrices.pop(previous_owner, None)
+        if not row.deleted:
+            self.partitions.setdefault(row.user_id, {})[row.entry_id] = (
+                self._row_to_item(row)
+            )
+            self._owner[row.entry_id] = row.user_id
+            self._matrices.pop(row.user_id, None)
+
+    def refresh(self, force: bool = False):
+        """其他 worker 写入后，增量拉取 generation 之后变化的行"""
+        self._ensure_loaded()
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.refresh_interval:
+            return
+        with self._lock:
+            with self.engine.connect() as conn:
+                generation = self._current_generation(conn)
+                self._checked_at = now
+                if generation == self.generation:
+                    return
+                rows = conn.execute(
+                    select(EntryVector).where(EntryVector.generation > self.generation)
+                ).all()
+            for row in rows:
+                if self._listeners and row.generation not in self._own_generations:
+                    self._external_changes.add(row.entry_id)
+                self._apply_row(row)
+            self.generation = generation
+            self._own_generations = {g for g in self._own_generations if g > generation}
+
+    def _bump_generation(self, conn) -> int:
+        """在当前事务中递增并返回全局 generation（数据库行锁保证串行）"""
+        updated = conn.execute(
+            update(VectorStoreMeta)
+            .where(VectorStoreMeta.id == 1)
+            .values(generation=VectorStoreMeta.generation + 1)
+        )
+        if updated.rowcount == 0:
+            # 先 UPDATE 再 INSERT 在并发的第一次写入时会冲突，这一行由 seed_generation 预先写入
+            raise RuntimeError("vector_store_meta is not initialized")
+        return self._current_generation(conn)
+
+    def seed_generation(self):
+        """写入 generation 行（init_db / 建表时调用，多个 worker 同时启动时忽略主键冲突）"""
+        try:
+            with self.engine.begin() as conn:
+                row = conn.execute(
+                    select(VectorStoreMeta.id).where(VectorStoreMeta.id == 1)
+                ).first()
+                if row is None:
+                    conn.execute(insert(VectorStoreMeta).values(id=1, generation=0))
+        except IntegrityError:
+            pass
+
+    def _upsert(self, conn, values: dict):
+        entry_id = values["entry_id"]
+        exists = conn.execute(
+            select(EntryVector.entry_id).where(EntryVector.entry_id == entry_id)
+        ).first()
+        if exists:
+            conn.execute(
+                update(EntryVector)
+                .where(EntryVector.entry_id == entry_id)
+                .values(**values)
+            )
+        else:
+            conn.execute(insert(EntryVector).values(**values))
+
+    def add_entries(self, items, only_current: bool = False) -> List[int]:
+        """
+        批量添加条目（同一个事务），返回写入的 entry_id
+        items 为字典的可迭代对象，键为 entry_id, content, embedding, metadata，
+        可选 user_id, entry_version。
+        only_current 为 True 时在同一事务中重新检查条目，跳过已删除或
+        version / 用户已变化的条目（后台修复与请求并发时使用）
+        """
+        self._ensure_tables()
+        items = list(items)
+        entry_ids = []
+        with self.engine.begin() as conn:
+            if only_current:
+                items = self._current_items(conn, items)
+                if not items:
+                    return []
+            generation = self._bump_generation(conn)
+            with self._lock:
+                self._own_generations.add(generation)
+            for item in items:
+                entry_ids.append(item["entry_id"])
+                self._upsert(
+                    conn,
+                    {
+                        "entry_id": item["entry_id"],
+                        "embedding": np.asarray(
+                            item["embedding"], dtype=np.float32
+                        ).tobytes(),
+                        "content": item["content"],
+                        "metadata_json": json.dumps(
+                            item["metadata"], ensure_ascii=False
+                        ),
+                        "user_id": item.get("user_id"),
+                        "entry_version": item.get("entry_version"),
+                        "generation": generation,
+                        "deleted": 0,
+                    },
+                )
+        if self._loaded:
+            self.refresh(force=True)
+        self._notify("added", entry_ids)
+        return entry_ids
 
-        query_vec = np.array(embedding)
-        similarities = []
+    @staticmethod
+    def _current_items(conn, items: List[dict]) -> List[dict]:
+        """只保留条目仍存在且 version、用户与 item 一致的项（锁定这些条目行）"""
+        current = {
+            row.id: row
+            for row in conn.execute(
+                select(Entry.id, Entry.version, Entry.user_id)
+                .where(
+                    Entry.id.in_([item["entry_id"] for item in items]),
+                    Entry.deleted == 0,
+                )
+                .with_for_update()
+            )
+        }
+        return [
+            item
+            for item in items
+            if item["entry_id"] in current
+            and current[item["entry_id"]].version == item.get("entry_version")
+            and current[item["entry_id"]].user_id == item.get("user_id")
+        ]
 
-        for entry_id, data in self.vectors.items():
-            stored_vec = np.array(data["embedding"])
-            # 计算余弦相似度
-            similarity = np.dot(query_vec, stored_vec) / (
-                np.linalg.norm(query_vec) * np.linalg.norm(stored_vec) + 1e-10
+    def _ensure_tables(self):
+        if not self._loaded:
+            Base.metadata.create_all(
+                bind=self.engine,
+                tables=[EntryVector.__table__, VectorStoreMeta.__table__],
             )
-            similarities.append((entry_id, 1 - similarity))  # 转换为距离
+            self.seed_generation()
+
+    def add_entry(
+        self,
+        entry_id: int,
+        content: str,
+        embedding: list,
+        metadata: dict,
+        user_id: Optional[int] = None,
+        entry_version: Optional[int] = None,
+    ):
+        """添加条目到向量数据库（预热未完成时只写入数据库）"""
+        self.add_entries(
+            [
+                {
+                    "entry_id": entry_id,
+                    "content": content,
+                    "embedding": embedding,
+                    "metadata": metadata,
+                    "user_id": user_id,
+                    "entry_version": entry_version,
+                }
+            ]
+        )
+
+    def _get_matrix(self, user_id: Optional[int]):
+        """返回某个用户分区的 (ids, 归一化后的向量矩阵)，数据变化后重新构建"""
+        with self._lock:
+            cached = self._matrices.get(user_id)
+            if cached is None:
+                vectors = self.partitions.get(user_id, {})
+                ids = list(vectors.keys())
+                if ids:
+                    matrix = np.stack([vectors[i]["embedding"] for i in ids])
+                    norms = np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-10
+                    matrix = matrix / norms
+                else:
+                    matrix = np.empty((0, 0), dtype=np.float32)
+                cached = (ids, matrix)
+                self._matrices[user_id] = cached
+            return cached
+
+    def matrix(self, user_id: Optional[int]):
+        """某个用户分区的 (ids, 归一化后的向量矩阵)"""
+        return self._get_matrix(user_id)
+
+    @property
+    def owners(self) -> Mapping[int, Optional[int]]:
+        """{entry_id: user_id} 的只读视图"""
+        return MappingProxyType(self._owner)
+
+    def partition_users(self) -> List[Optional[int]]:
+        with self._lock:
+            return list(self.partitions)
+
+    def partition_size(self, user_id: Optional[int]) -> int:
+        return len(self.partitions.get(user_id, ()))
+
+    def search_similar(
+        self, embedding: list, n_results: int = 5, user_id: Optional[int] = None
+    ):
+        """在某个用户的分区内搜索相似条目（使用余弦相似度）"""
+        self.refresh()
+        ids, matrix = self._get_matrix(user_id)
+        if not ids:
+            return {"ids": [[]], "distances": [[]]}
+
+        query_vec = np.asarray(embedding, dtype=np.float32)
+        query_vec = query_vec / (np.linalg.norm(query_vec) + 1e-10)
+        distances = 1 - matrix @ query_vec  # 转换为距离
 
-        # 按距离排序（距离越小越相似）
-        similarities.sort(key=lambda x: x[1])
+        # 取距离最小的 n_results 个
+        k = min(n_results, len(ids))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top], kind="stable")]
 
-        # 返回前 n_results 个
-        top_results = similarities[:n_results]
-        ids = [[str(entry_id) for entry_id, _ in top_results]]
-        distances = [[dist for _, dist in top_results]]
+        return {
+            "ids": [[str(ids[i]) for i in top]],
+            "distances": [[float(distances[i]) for i in top]],
+        }
+
+    def reassign_owner(self, from_user_id: Optional[int], to_user_id: Optional[int]):
+        """把一个分区的向量整体转给另一个用户"""
+        self._ensure_tables()
+        owner = (
+            EntryVector.user_id.is_(None)
+            if from_user_id is None
+            else EntryVector.user_id == from_user_id
+        )
+        with self.engine.begin() as conn:
+            generation = self._bump_generation(conn)
+            conn.execute(
+                update(EntryVector)
+                .where(owner)
+                .values(user_id=to_user_id, generation=generation)
+            )
+        if self._loaded:
+            self.refresh(force=True)
 
-        return {"ids": ids, "distances": distances}
+    def delete_entries(self, entry_ids, only_orphaned: bool = False) -> List[int]:
+        """
+        批量删除条目（保留墓碑行，供其他 worker 增量同步删除），返回删除的 entry_id。
+        only_orphaned 为 True 时在同一事务中只删除条目已不存在或已软删除的向量
+        """
+        entry_ids = list(entry_ids)
+        if not entry_ids:
+            return []
+        self._ensure_tables()
+        with self.engine.begin() as conn:
+            query = select(EntryVector.entry_id).where(
+                EntryVector.entry_id.in_(entry_ids), EntryVector.deleted == 0
+            )
+            if only_orphaned:
+                query = query.where(
+                    ~exists().where(
+                        Entry.id == EntryVector.entry_id, Entry.deleted == 0
+                    )
+                )
+            existing = conn.execute(query).scalars().all()
+            if not existing:
+                return []
+            generation = self._bump_generation(conn)
+            with self._lock:
+                self._own_generations.add(generation)
+            conn.execute(
+                update(EntryVector)
+                .where(EntryVector.entry_id.in_(existing))
+                .values(embedding=None, deleted=1, generation=generation)
+            )
+        if self._loaded:
+            self.refresh(force=True)
+        self._notify("deleted", existing)
+        return existing
 
     def delete_entry(self, entry_id: int):
         """删除条目"""
-        if entry_id in self.vectors:
-            del self.vectors[entry_id]
-            self._save()
+        self.delete_entries([entry_id])
 
 
 # 全局向量数据库实例
 vector_db = VectorDB()
 
 
+def _owned_by(query, user_id: Optional[int]):
+    """按用户过滤条目（user_id 为 None 时对应未登录创建的条目）"""
+    if user_id is None:
+        return query.filter(Entry.user_id.is_(None))
+    return query.filter(Entry.user_id == user_id)
+
+
 def create_entry(
     db: Session,
     content: str,
@@ -135,6 +752,8 @@ def create_entry(
     note: str,
     ai_analysis: str,
     tags: str,
+    analysis_status: str = "ok",
+    user_id: Optional[int] = None,
 ):
     entry = Entry(
         content=content,
@@ -142,56 +761,271 @@ def create_entry(
         source=source,
         note=note,
         ai_analysis=ai_analysis,
+        **analysis_fields(ai_analysis),
         tags=tags,
         device_id=get_device_id(),
         sync_status="synced",
+        analysis_status=analysis_status,
+        user_id=user_id,
     )
     db.add(entry)
+    db.flush()
+    _record(db, added=[entry])
     db.commit()
     db.refresh(entry)
     return entry
 
 
-def get_all_entries(db: Session, skip: int = 0, limit: int = 100):
-    """获取所有条目"""
-    return (
-        db.query(Entry)
-        .order_by(Entry.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
+def _record(db: Session, added=(), removed=()):
+    """在当前事务中更新物化统计"""
+    delta = StatsDelta()
+    for entry in removed:
+        delta.entry_removed(entry)
+    for entry in added:
+        delta.entry_added(entry)
+    delta.apply(db)
+
+
+class _Snapshot:
+    """修改前的统计相关字段"""
+
+    def __init__(self, entry: Entry):
+        self.user_id = entry.user_id
+        self.created_at = entry.created_at
+        self.entry_type = entry.entry_type
+        self.tags = entry.tags
+
 
+def _record_change(db: Session, before: _Snapshot, entry: Entry):
+    if (before.entry_type, before.tags) != (entry.entry_type, entry.tags):
+        _record(db, added=[entry], removed=[before])
 
-def get_entry_by_id(db: Session, entry_id: int):
-    """根据 ID 获取条目"""
-    return db.query(Entry).filter(Entry.id == entry_id).first()
 
+def get_all_entries(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    user_id: Optional[int] = None,
+    part_of_speech: Optional[str] = None,
+    sentence_function: Optional[str] = None,
+):
+    """获取用户的所有条目，可按词性或句子功能筛选（走对应的索引）"""
+    query = _owned_by(db.query(Entry), user_id)
+    if part_of_speech:
+        query = query.filter(Entry.part_of_speech == part_of_speech.strip().lower())
+    if sentence_function:
+        query = query.filter(
+            Entry.sentence_function == function_category(sentence_function)
+        )
+    return query.order_by(Entry.created_at.desc()).offset(skip).limit(limit).all()
+
+
+def get_entry_by_id(db: Session, entry_id: int, user_id: Optional[int] = None):
+    """根据 ID 获取用户的条目"""
+    return _owned_by(db.query(Entry), user_id).filter(Entry.id == entry_id).first()
 
-def delete_entry_by_id(db: Session, entry_id: int):
-    """删除条目"""
-    entry = db.query(Entry).filter(Entry.id == entry_id).first()
+
+def delete_entry_by_id(db: Session, entry_id: int, user_id: Optional[int] = None):
+    """删除用户的条目"""
+    entry = _owned_by(db.query(Entry), user_id).filter(Entry.id == entry_id).first()
     if entry:
+        if not entry.deleted:
+            _record(db, removed=[entry])
         db.delete(entry)
         db.commit()
         return True
     return False
 
 
-def search_entries(db: Session, query: str):
-    """搜索条目（简单文本搜索）"""
+def get_degraded_entries(db: Session, limit: int = 20) -> List[Entry]:
+    """获取已到重试时间、需要重新分析的条目（最早到期的优先）"""
+    now = datetime.utcnow()
     return (
         db.query(Entry)
+        .filter(
+            Entry.analysis_status == "degraded",
+            Entry.deleted == 0,
+            (Entry.next_analysis_at.is_(None)) | (Entry.next_analysis_at <= now),
+        )
+        .order_by(func.coalesce(Entry.next_analysis_at, Entry.created_at).asc())
+        .limit(limit)
+        .all()
+    )
+
+
+def claim_degraded_entry(db: Session, entry: Entry, lease_seconds: float) -> bool:
+    """
+    认领一个降级条目：把 next_analysis_at 推迟 lease_seconds，只有值未被其他 worker
+    改过时才成功。多个 worker 同时重新分析时每个条目只会被处理一次
+    """
+    claimed = db.execute(
+        update(Entry)
+        .where(
+            Entry.id == entry.id,
+            Entry.analysis_status == "degraded",
+            Entry.next_analysis_at.is_not_distinct_from(entry.next_analysis_at),
+        )
+        .values(
+            next_analysis_at=datetime.utcnow() + timedelta(seconds=lease_seconds),
+            updated_at=Entry.updated_at,
+        )
+    ).rowcount
+    db.commit()
+    if claimed:
+        db.refresh(entry)
+    return bool(claimed)
+
+
+def defer_entry_analysis(
+    db: Session, entry: Entry, base_delay: float = 60.0, max_delay: float = 86400.0
+):
+    """重新分析仍失败：增加失败次数，按指数退避推迟下一次重试，让其他条目先处理"""
+    attempts = (entry.analysis_attempts or 0) + 1
+    delay = min(max_delay, base_delay * (2 ** (attempts - 1)))
+    db.execute(
+        update(Entry)
+        .where(Entry.id == entry.id)
+        .values(
+            analysis_attempts=attempts,
+            next_analysis_at=datetime.utcnow() + timedelta(seconds=delay),
+            # 重试记录不算内容修改，不触发同步
+            updated_at=Entry.updated_at,
+        )
+    )
+    db.commit()
+
+
+def update_entry_analysis(
+    db: Session, entry: Entry, entry_type: str, ai_analysis: str, tags: str
+) -> Entry:
+    """用重新分析的结果更新条目"""
+    before = _Snapshot(entry)
+    entry.entry_type = entry_type
+    _set_analysis(entry, ai_analysis)
+    entry.tags = tags
+    entry.analysis_status = "ok"
+    entry.analysis_attempts = 0
+    entry.next_analysis_at = None
+    entry.version = (entry.version or 1) + 1
+    _record_change(db, before, entry)
+    db.commit()
+    db.refresh(entry)
+    return entry
+
+
+def get_due_entries(
+    db: Session,
+    limit: int = 20,
+    user_id: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> List[Entry]:
+    """按到期时间取出用户最早到期的条目（走 (user_id, due_at) 索引）"""
+    now = now or datetime.utcnow()
+    return (
+        _owned_by(db.query(Entry), user_id)
+        .filter(Entry.due_at <= now, Entry.deleted == 0)
+        .order_by(Entry.due_at.asc())
+        .limit(limit)
+        .all()
+    )
+
+
+def grade_entries(
+    db: Session,
+    grades: Iterable[Tuple[int, int, Optional[datetime]]],
+    user_id: Optional[int] = None,
+) -> Tuple[List[Entry], List[int], List[int]]:
+    """
+    应用一批 (entry_id, grade, reviewed_at) 评分，在一个事务中提交。
+    同一条目的多次评分按复习时间先后依次计算；早于条目上次复习时间的评分
+    （迟到的离线提交）会被跳过，不会把 due_at 往回调。
+    只写复习相关的列，不更新 updated_at（否则同步时会覆盖更早的离线编辑）。
+    返回 (更新后的条目, 不存在的 id, 被跳过的 id)
+    """
+    now = datetime.utcnow()
+    grades = sorted(
+        (
+            (entry_id, grade, reviewed_at or now)
+            for entry_id, grade, reviewed_at in grades
+        ),
+        key=lambda item: item[2],
+    )
+    ids = {entry_id for entry_id, _, _ in grades}
+    entries = {
+        entry.id: entry
+        for entry in _owned_by(db.query(Entry), user_id)
+        .filter(Entry.id.in_(ids), Entry.deleted == 0)
+        .with_for_update()
+    }
+
+    schedules = {}
+    skipped = set()
+    delta = StatsDelta()
+    for entry_id, grade, reviewed_at in grades:
+        entry = entries.get(entry_id)
+        if entry is None:
+            continue
+        state = schedules.get(entry_id) or {
+            "ease_factor": entry.ease_factor,
+            "interval_days": entry.interval_days,
+            "repetitions": entry.repetitions,
+            "last_reviewed_at": entry.last_reviewed_at,
+        }
+        if state["last_reviewed_at"] and reviewed_at < state["last_reviewed_at"]:
+            skipped.add(entry_id)
+            continue
+        schedule = next_schedule(
+            state["ease_factor"],
+            state["interval_days"],
+            state["repetitions"],
+            grade,
+            reviewed_at,
+        )
+        schedules[entry_id] = {**schedule._asdict(), "last_reviewed_at": reviewed_at}
+        delta.entry_reviewed(entry, reviewed_at, grade >= PASS_GRADE)
+
+    if schedules:
+        db.connection().execute(
+            update(Entry)
+            .where(Entry.id == bindparam("entry_id"))
+            .values(
+                ease_factor=bindparam("ease_factor"),
+                interval_days=bindparam("interval_days"),
+                repetitions=bindparam("repetitions"),
+                due_at=bindparam("due_at"),
+                last_reviewed_at=bindparam("last_reviewed_at"),
+                updated_at=Entry.updated_at,
+            ),
+            [{"entry_id": i, **values} for i, values in schedules.items()],
+        )
+    delta.apply(db)
+    db.commit()
+    for entry in entries.values():
+        db.refresh(entry)
+    not_found = sorted(ids - entries.keys())
+    updated = [entries[i] for i in sorted(schedules)]
+    return updated, not_found, sorted(skipped - schedules.keys())
+
+
+def search_entries(db: Session, query: str, user_id: Optional[int] = None):
+    """搜索用户的条目（简单文本搜索）"""
+    return (
+        _owned_by(db.query(Entry), user_id)
         .filter(Entry.content.contains(query) | Entry.tags.contains(query))
         .all()
     )
 
 
 def get_entries_since(
-    db: Session, since: datetime, device_id: Optional[str] = None
+    db: Session,
+    since: datetime,
+    device_id: Optional[str] = None,
+    user_id: Optional[int] = None,
 ) -> List[Entry]:
-    """获取指定时间之后更新的条目"""
-    query = db.query(Entry).filter(Entry.updated_at >= since, Entry.deleted == 0)
+    """获取用户在指定时间之后更新的条目"""
+    query = _owned_by(db.query(Entry), user_id).filter(
+        Entry.updated_at >= since, Entry.deleted == 0
+    )
     if device_id:
         query = query.filter(Entry.device_id != device_id)
     return query.order_by(Entry.updated_at.desc()).all()
@@ -206,6 +1040,7 @@ def create_entry_sync(
     ai_analysis: str,
     tags: str,
     device_id: str,
+    user_id: Optional[int] = None,
 ) -> Entry:
     """创建条目（带同步信息）"""
     entry = Entry(
@@ -214,11 +1049,15 @@ def create_entry_sync(
         source=source,
         note=note,
         ai_analysis=ai_analysis,
+        **analysis_fields(ai_analysis),
         tags=tags,
         device_id=device_id,
         sync_status="synced",
+        user_id=user_id,
     )
     db.add(entry)
+    db.flush()
+    _record(db, added=[entry])
     db.commit()
     db.refresh(entry)
     return entry
@@ -234,40 +1073,52 @@ def update_entry_sync(
     ai_analysis: str,
     tags: str,
     version: int,
+    user_id: Optional[int] = None,
 ) -> Optional[Entry]:
     """更新条目（带版本控制）"""
-    entry = db.query(Entry).filter(Entry.id == entry_id).first()
+    entry = _owned_by(db.query(Entry), user_id).filter(Entry.id == entry_id).first()
     if not entry:
         return None
     if entry.version != version:
         return None
+    before = _Snapshot(entry)
     entry.content = content
     entry.entry_type = entry_type
     entry.source = source
     entry.note = note
-    entry.ai_analysis = ai_analysis
+    _set_analysis(entry, ai_analysis)
     entry.tags = tags
     entry.version = version + 1
     entry.sync_status = "synced"
+    _record_change(db, before, entry)
     db.commit()
     db.refresh(entry)
     return entry
 
 
-def delete_entry_sync(db: Session, entry_id: int) -> bool:
+def delete_entry_sync(
+    db: Session, entry_id: int, user_id: Optional[int] = None
+) -> bool:
     """软删除条目（用于同步）"""
-    entry = db.query(Entry).filter(Entry.id == entry_id).first()
+    entry = _owned_by(db.query(Entry), user_id).filter(Entry.id == entry_id).first()
     if not entry:
         return False
+    if not entry.deleted:
+        _record(db, removed=[entry])
     entry.deleted = 1
     entry.sync_status = "synced"
     db.commit()
     return True
 
 
-def sync_entries(db: Session, local_entries: List[SyncEntry], device_id: str) -> tuple:
-    """同步本地条目到服务器"""
-    server_entries = db.query(Entry).all()
+def sync_entries(
+    db: Session,
+    local_entries: List[SyncEntry],
+    device_id: str,
+    user_id: Optional[int] = None,
+) -> tuple:
+    """同步本地条目到服务器（只涉及该用户的条目）"""
+    server_entries = _owned_by(db.query(Entry), user_id).all()
     conflicts = []
 
     local_map = {entry.id: entry for entry in local_entries}
@@ -278,6 +1129,8 @@ def sync_entries(db: Session, local_entries: List[SyncEntry], device_id: str) ->
 
         if entry.deleted == 1:
             if server_entry:
+                if not server_entry.deleted:
+                    _record(db, removed=[server_entry])
                 server_entry.deleted = 1
                 server_entry.sync_status = "synced"
                 db.commit()
@@ -289,14 +1142,16 @@ def sync_entries(db: Session, local_entries: List[SyncEntry], device_id: str) ->
                 ):
                     conflicts.append(entry)
                 else:
+                    before = _Snapshot(server_entry)
                     server_entry.content = entry.content
                     server_entry.entry_type = entry.entry_type
                     server_entry.source = entry.source
                     server_entry.note = entry.note
-                    server_entry.ai_analysis = entry.ai_analysis
+                    _set_analysis(server_entry, entry.ai_analysis)
                     server_entry.tags = entry.tags
                     server_entry.version = max(server_entry.version, entry.version) + 1
                     server_entry.sync_status = "synced"
+                    _record_change(db, before, server_entry)
                     db.commit()
 
     db.commit()
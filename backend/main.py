@@ -1,11 +1,25 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, Header, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+from starlette.routing import Match
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
+import anyio
+import asyncio
+import calendar
 import json
 import jwt
-import bcrypt
+import logging
+import secrets
+import time
 from datetime import datetime, timedelta
 from typing import List, Optional
 
@@ -22,9 +36,16 @@ from models import (
     UserLogin,
     UserResponse,
     Token,
+    PasswordChange,
+    ReviewBatch,
+    ReviewBatchResponse,
+    ReviewEntry,
+    ReviewGrade,
     User as UserModel,
 )
 from database import (
+    SessionLocal,
+    engine,
     get_db,
     init_db,
     vector_db,
@@ -34,10 +55,34 @@ from database import (
     delete_entry_by_id,
     sync_entries,
     get_device_id,
+    get_degraded_entries,
+    claim_degraded_entry,
+    defer_entry_analysis,
+    update_entry_analysis,
+    get_due_entries,
+    grade_entries,
+    claim_legacy_entries,
+)
+from ai_service import analyze_content, generate_embedding, llm_caller
+from admission import AdmissionController, AdmissionRejected
+from observability import (
+    Gauge,
+    current_route,
+    get_logger,
+    log_event,
+    registry,
+    request_latency,
+    span,
 )
-from ai_service import analyze_content, generate_embedding
+from profiling import RequestProfiler
+from auth import PasswordHashBusy, TokenCache, hash_password, verify_password
+from consistency import ConsistencyJob
+from transfer import FORMATS, export_entries, import_entries
+from stats import get_stats, recompute_stats
+from neighbors import NeighborIndex
 
 app = FastAPI(title="English Study Tool API")
+logger = get_logger("english_study")
 
 # JWT 配置
 import os
@@ -46,7 +91,146 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
+# 管理员令牌（用于 /admin 接口和按需 profiling），未设置时管理功能关闭
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# 已有注册用户时是否仍允许不带 token 访问条目接口（只读写未归属用户的条目）
+ALLOW_ANONYMOUS = os.getenv("ALLOW_ANONYMOUS", "false").lower() == "true"
+
+# 降级条目的重新分析间隔（秒）
+REANALYZE_INTERVAL_SECONDS = float(os.getenv("REANALYZE_INTERVAL_SECONDS", "60"))
+# 认领一个降级条目后的租约（秒），worker 中途退出时租约到期后由其他 worker 重试
+REANALYZE_LEASE_SECONDS = float(os.getenv("REANALYZE_LEASE_SECONDS", "300"))
+
+# 处理向量变化、更新相似条目的间隔（秒）
+NEIGHBOR_UPDATE_INTERVAL_SECONDS = float(
+    os.getenv("NEIGHBOR_UPDATE_INTERVAL_SECONDS", "1")
+)
+
+# 补算缺失的相似条目的间隔（秒）
+NEIGHBOR_REBUILD_INTERVAL_SECONDS = float(
+    os.getenv("NEIGHBOR_REBUILD_INTERVAL_SECONDS", "30")
+)
+
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+# 向量存储一致性检查（后台任务）
+consistency_job = ConsistencyJob()
+
+# 预先计算的相似条目，随向量的增删增量更新
+neighbor_index = NeighborIndex(vector_db)
+vector_db.add_listener(neighbor_index.on_vectors_changed)
+
+# 已验证 token 的短期缓存
+token_cache = TokenCache(
+    ttl=float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60")),
+    epoch_ttl=float(os.getenv("AUTH_EPOCH_TTL_SECONDS", "5")),
+)
+
+# AI 接口的准入控制：每个用户/设备限流 + 全局并发队列
+llm_admission = AdmissionController(
+    rate_per_minute=float(os.getenv("LLM_RATE_PER_MINUTE", "20")),
+    burst=int(os.getenv("LLM_RATE_BURST", "10")),
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "32")),
+    max_wait=float(os.getenv("LLM_MAX_QUEUE_WAIT_SECONDS", "10")),
+)
+
+registry.register(
+    Gauge(
+        "admission_queue_depth",
+        "Requests waiting for an AI execution slot",
+        lambda: llm_admission.waiting,
+    )
+)
+registry.register(
+    Gauge(
+        "admission_in_flight",
+        "Requests currently holding an AI execution slot",
+        lambda: llm_admission.in_flight,
+    )
+)
+
+
+def route_label(request: Request) -> str:
+    """解析请求对应的路由模板（如 /entries/{entry_id}），避免标签基数过大"""
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", request.url.path)
+    return "unmatched"
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    route = route_label(request)
+    token = current_route.set(route)
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        request_latency.observe(
+            time.perf_counter() - started,
+            route=route,
+            method=request.method,
+            status=str(status_code),
+        )
+        current_route.reset(token)
+
+
+# 按需 profiling：请求头 X-Profile: <ADMIN_TOKEN> 或按比例采样
+request_profiler = RequestProfiler(
+    capacity=int(os.getenv("PROFILE_BUFFER_SIZE", "50")),
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+)
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    return (
+        bool(ADMIN_TOKEN) and bool(token) and secrets.compare_digest(token, ADMIN_TOKEN)
+    )
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """管理员接口的鉴权"""
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    request_profiler.request_started()
+    try:
+        forced = is_admin_token(request.headers.get("X-Profile"))
+        if not request_profiler.should_profile(forced):
+            return await call_next(request)
+
+        profiler = request_profiler.start(forced)
+        if profiler is None:
+            return await call_next(request)
+
+        started = time.perf_counter()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            request_profiler.finish(
+                profiler,
+                method=request.method,
+                path=request.url.path,
+                route=route_label(request),
+                status_code=status_code,
+                latency=time.perf_counter() - started,
+            )
+    finally:
+        request_profiler.request_finished()
+
 
 # CORS 配置
 app.add_middleware(
@@ -58,13 +242,278 @@ app.add_middleware(
 )
 
 
-# 初始化数据库
+# 启动预热状态：schema 在启动时同步完成，vectors 在后台加载，全部完成后 /health/ready 返回 200
+warmup_state = {
+    "schema": "pending",
+    "vectors": "pending",
+    "started_at": None,
+    "finished_at": None,
+    "error": None,
+}
+
+
+async def init_schema():
+    """初始化/迁移数据库结构（在接受请求之前完成，否则接口会读到旧的表结构）"""
+    warmup_state["started_at"] = datetime.utcnow()
+    warmup_state["schema"] = "loading"
+    await asyncio.to_thread(init_db)
+    warmup_state["schema"] = "ready"
+    log_event(logger, "database_initialized")
+
+
+async def warm_up():
+    """后台预热：加载向量索引"""
+    try:
+        warmup_state["vectors"] = "loading"
+        await asyncio.to_thread(vector_db.warm_up)
+        warmup_state["vectors"] = "ready"
+        warmup_state["finished_at"] = datetime.utcnow()
+        asyncio.create_task(neighbor_update_loop())
+        asyncio.create_task(neighbor_rebuild_loop())
+        log_event(
+            logger,
+            "warm_up_finished",
+            vectors=vector_db.load_progress["loaded"],
+            seconds=(
+                warmup_state["finished_at"] - warmup_state["started_at"]
+            ).total_seconds(),
+        )
+    except Exception as e:
+        warmup_state["error"] = str(e)
+        log_event(logger, "warm_up_failed", level=logging.ERROR, error=str(e))
+
+
 @app.on_event("startup")
 async def startup_event():
-    init_db()
-    print("Database initialized!")
-    print("Server is running at http://localhost:8000")
-    print("API docs available at http://localhost:8000/docs")
+    try:
+        await init_schema()
+    except Exception as e:
+        warmup_state["error"] = str(e)
+        log_event(logger, "warm_up_failed", level=logging.ERROR, error=str(e))
+        raise
+    asyncio.create_task(reanalyze_degraded_loop())
+    # 向量索引在后台加载，预热期间非向量接口即可提供服务
+    asyncio.create_task(warm_up())
+    log_event(logger, "server_started", url="http://localhost:8000", docs="/docs")
+
+
+# 认证相关函数
+def resolve_user(token: str, db: Session) -> Optional[UserModel]:
+    """校验 token 并返回对应用户（结果在 token_cache 中短期缓存）"""
+    cached = token_cache.get(token, lambda username: _password_epoch(db, username))
+    if cached is not None:
+        return cached
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        username: str = payload.get("sub")
+        if username is None:
+            return None
+    except jwt.PyJWTError:
+        return None
+
+    user = db.query(UserModel).filter(UserModel.username == username).first()
+    if user is None:
+        return None
+
+    # 修改密码之前签发的 token 失效
+    if user.password_changed_at is not None and payload.get("iat", 0) < (
+        calendar.timegm(user.password_changed_at.utctimetuple())
+    ):
+        return None
+
+    # 脱离会话后缓存，供后续请求只读使用
+    db.expunge(user)
+    token_cache.set(token, username, user, payload["exp"], payload.get("iat", 0))
+    return user
+
+
+def _password_epoch(db: Session, username: str) -> Optional[float]:
+    """用户修改密码的时间戳（其他 worker 修改密码后，缓存的旧 token 据此失效）"""
+    row = (
+        db.query(UserModel.password_changed_at)
+        .filter(UserModel.username == username)
+        .first()
+    )
+    if row is None:
+        # 用户已删除，所有 token 都失效
+        return float("inf")
+    changed_at = row.password_changed_at
+    return calendar.timegm(changed_at.utctimetuple()) if changed_at else None
+
+
+def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+) -> Optional[UserModel]:
+    """获取当前用户"""
+    return resolve_user(credentials.credentials, db)
+
+
+_users_exist = False
+
+
+def _has_users(db: Session) -> bool:
+    """是否已有注册用户（有了之后不会再变回没有，缓存结果）"""
+    global _users_exist
+    if not _users_exist:
+        _users_exist = db.query(UserModel.id).first() is not None
+    return _users_exist
+
+
+def get_current_user_id(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: Session = Depends(get_db),
+) -> Optional[int]:
+    """
+    当前用户 ID，条目相关接口都按它过滤
+    未携带 token 时为 None（对应未登录创建的条目），只在还没有注册用户
+    或设置了 ALLOW_ANONYMOUS 时允许；token 无效时返回 401
+    """
+    if credentials is None:
+        if ALLOW_ANONYMOUS or not _has_users(db):
+            return None
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="未登录或登录已过期"
+        )
+    user = resolve_user(credentials.credentials, db)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="未登录或登录已过期"
+        )
+    return user.id
+
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    """创建访问令牌"""
+    to_encode = data.copy()
+    if expires_delta:
+        expire = datetime.utcnow() + expires_delta
+    else:
+        expire = datetime.utcnow() + timedelta(minutes=15)
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
+    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return encoded_jwt
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": f"Too many requests ({exc.reason})"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(PasswordHashBusy)
+async def password_hash_busy_handler(request: Request, exc: PasswordHashBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Authentication service is busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+
+def rate_limit_key(request: Request) -> str:
+    """
+    限流的 key：登录用户按用户，未登录按客户端 IP。
+    不使用 X-Device-ID：它由客户端任意指定，每次换一个就能绕过限流
+    """
+    authorization = request.headers.get("Authorization", "")
+    if authorization.lower().startswith("bearer "):
+        try:
+            payload = jwt.decode(authorization[7:], SECRET_KEY, algorithms=[ALGORITHM])
+            if payload.get("sub"):
+                return f"user:{payload['sub']}"
+        except jwt.PyJWTError:
+            pass
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+async def reanalyze_degraded_entries(batch_size: int = 20) -> int:
+    """
+    重新分析 AI 调用失败时保存的降级条目，返回成功更新的数量。
+    每个条目先原子地认领，AI 调用与前台请求共用 llm_admission 的并发上限
+    """
+    db = SessionLocal()
+    updated = 0
+    try:
+        entries = await run_in_threadpool(get_degraded_entries, db, batch_size)
+        for entry in entries:
+            # 上游仍不可用时不再继续消耗请求
+            if llm_caller.breaker.state == "open":
+                break
+            claimed = await run_in_threadpool(
+                claim_degraded_entry, db, entry, REANALYZE_LEASE_SECONDS
+            )
+            if not claimed:
+                continue
+            try:
+                async with llm_admission.slot("background:reanalyze"):
+                    ai_result = await run_in_threadpool(
+                        analyze_content, entry.content, entry.source, entry.note
+                    )
+            except AdmissionRejected:
+                # 前台请求繁忙，让出执行槽位，租约到期后再重试
+                break
+            if ai_result["degraded"]:
+                await run_in_threadpool(
+                    defer_entry_analysis,
+                    db,
+                    entry,
+                    base_delay=REANALYZE_INTERVAL_SECONDS,
+                )
+                continue
+            await run_in_threadpool(
+                update_entry_analysis,
+                db,
+                entry,
+                entry_type=ai_result["entry_type"],
+                ai_analysis=json.dumps(ai_result["analysis"], ensure_ascii=False),
+                tags=",".join(ai_result["tags"]),
+            )
+            updated += 1
+    finally:
+        db.close()
+    return updated
+
+
+async def reanalyze_degraded_loop():
+    """后台定期重新分析降级条目"""
+    while True:
+        await asyncio.sleep(REANALYZE_INTERVAL_SECONDS)
+        try:
+            updated = await reanalyze_degraded_entries()
+            if updated:
+                log_event(logger, "degraded_entries_reanalyzed", count=updated)
+        except Exception as e:
+            log_event(logger, "reanalyze_failed", level=logging.ERROR, error=str(e))
+
+
+async def neighbor_update_loop():
+    """后台处理向量变化队列，更新受影响条目的相似条目"""
+    while True:
+        await asyncio.sleep(NEIGHBOR_UPDATE_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(neighbor_index.process_pending)
+        except Exception as e:
+            log_event(
+                logger, "neighbor_update_failed", level=logging.ERROR, error=str(e)
+            )
+
+
+async def neighbor_rebuild_loop():
+    """后台定期为过期/缺失的条目重新计算相似条目"""
+    while True:
+        try:
+            computed = await asyncio.to_thread(neighbor_index.rebuild_missing)
+            if computed:
+                log_event(logger, "neighbors_rebuilt", count=computed)
+        except Exception as e:
+            log_event(
+                logger, "neighbor_rebuild_failed", level=logging.ERROR, error=str(e)
+            )
+        await asyncio.sleep(NEIGHBOR_REBUILD_INTERVAL_SECONDS)
 
 
 @app.get("/")
@@ -83,8 +532,39 @@ def root():
     }
 
 
+@app.get("/health/live")
+async def liveness():
+    """存活检查：进程能响应即可"""
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """就绪检查：数据库结构和向量索引都加载完成后返回 200"""
+    ready = warmup_state["schema"] == "ready" and warmup_state["vectors"] == "ready"
+    body = {
+        "status": "ready" if ready else "warming_up",
+        "schema": warmup_state["schema"],
+        "vectors": warmup_state["vectors"],
+        "vectors_loaded": vector_db.load_progress["loaded"],
+        "vectors_total": vector_db.load_progress["total"],
+        "started_at": warmup_state["started_at"],
+        "finished_at": warmup_state["finished_at"],
+        "error": warmup_state["error"],
+    }
+    return JSONResponse(
+        status_code=200 if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=jsonable_encoder(body),
+    )
+
+
 @app.post("/entries", response_model=EntryResponse)
-async def create_new_entry(entry: EntryCreate, db: Session = Depends(get_db)):
+async def create_new_entry(
+    entry: EntryCreate,
+    request: Request,
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(get_current_user_id),
+):
     """
     创建新条目
     1. 接收用户输入
@@ -94,60 +574,96 @@ async def create_new_entry(entry: EntryCreate, db: Session = Depends(get_db)):
     """
     try:
         # AI 分析
-        print(f"Analyzing content: {entry.content[:50]}...")
-        ai_result = analyze_content(entry.content, entry.source, entry.note)
+        async with llm_admission.slot(rate_limit_key(request)):
+            with span("analysis"):
+                ai_result = await run_in_threadpool(
+                    analyze_content, entry.content, entry.source, entry.note
+                )
 
         # 生成 embedding
-        print("Generating embedding...")
-        embedding = generate_embedding(entry.content)
+        with span("embedding"):
+            embedding = generate_embedding(entry.content)
 
         # 保存到 SQLite
-        print("Saving to database...")
-        db_entry = create_entry(
-            db=db,
-            content=entry.content,
-            entry_type=ai_result["entry_type"],
-            source=entry.source or "",
-            note=entry.note or "",
-            ai_analysis=json.dumps(ai_result["analysis"], ensure_ascii=False),
-            tags=",".join(ai_result["tags"]),
-        )
+        with span("db_write"):
+            db_entry = create_entry(
+                db=db,
+                content=entry.content,
+                entry_type=ai_result["entry_type"],
+                source=entry.source or "",
+                note=entry.note or "",
+                ai_analysis=json.dumps(ai_result["analysis"], ensure_ascii=False),
+                tags=",".join(ai_result["tags"]),
+                analysis_status="degraded" if ai_result["degraded"] else "ok",
+                user_id=user_id,
+            )
 
         # 保存到向量数据库
-        print(f"Saving to vector database (ID: {db_entry.id})...")
-        vector_db.add_entry(
+        with span("vector_write"):
+            vector_db.add_entry(
+                entry_id=db_entry.id,
+                content=entry.content,
+                embedding=embedding,
+                metadata={
+                    "entry_type": ai_result["entry_type"],
+                    "tags": ",".join(ai_result["tags"]),
+                },
+                user_id=user_id,
+                entry_version=db_entry.version,
+            )
+
+        log_event(
+            logger,
+            "entry_created",
             entry_id=db_entry.id,
-            content=entry.content,
-            embedding=embedding,
-            metadata={
-                "entry_type": ai_result["entry_type"],
-                "tags": ",".join(ai_result["tags"]),
-            },
+            entry_type=ai_result["entry_type"],
+            degraded=ai_result["degraded"],
         )
-
-        print(f"Entry created successfully! ID: {db_entry.id}")
         return db_entry
 
+    except AdmissionRejected:
+        raise
     except Exception as e:
-        print(f"Error creating entry: {e}")
+        log_event(logger, "create_entry_failed", level=logging.ERROR, error=str(e))
         raise HTTPException(status_code=500, detail=f"Failed to create entry: {str(e)}")
 
 
 @app.get("/entries", response_model=List[EntryResponse])
-async def get_entries(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """获取所有条目"""
+async def get_entries(
+    skip: int = 0,
+    limit: int = 100,
+    part_of_speech: Optional[str] = None,
+    sentence_function: Optional[str] = None,
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(get_current_user_id),
+):
+    """
+    获取当前用户的所有条目，可按词性（part_of_speech）或句子功能（sentence_function）筛选。
+    句子功能按类别（AI 描述的第一个词，如 emphasizing）精确匹配
+    """
     try:
-        entries = get_all_entries(db, skip=skip, limit=limit)
+        entries = get_all_entries(
+            db,
+            skip=skip,
+            limit=limit,
+            user_id=user_id,
+            part_of_speech=part_of_speech,
+            sentence_function=sentence_function,
+        )
         return entries
     except Exception as e:
-        print(f"Error getting entries: {e}")
+        log_event(logger, "get_entries_failed", level=logging.ERROR, error=str(e))
         raise HTTPException(status_code=500, detail=f"Failed to get entries: {str(e)}")
 
 
 @app.get("/entries/{entry_id}", response_model=EntryResponse)
-async def get_entry(entry_id: int, db: Session = Depends(get_db)):
+async def get_entry(
+    entry_id: int,
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(get_current_user_id),
+):
     """获取单个条目"""
-    entry = get_entry_by_id(db, entry_id)
+    entry = get_entry_by_id(db, entry_id, user_id=user_id)
     if not entry:
         raise HTTPException(status_code=404, detail="Entry not found")
     return entry
@@ -155,84 +671,344 @@ async def get_entry(entry_id: int, db: Session = Depends(get_db)):
 
 @app.get("/entries/{entry_id}/similar", response_model=List[SimilarEntry])
 async def find_similar_entries(
-    entry_id: int, limit: int = 5, db: Session = Depends(get_db)
+    entry_id: int,
+    limit: int = 5,
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(get_current_user_id),
 ):
-    """查找相似条目"""
+    """在当前用户的条目中查找相似条目"""
+    if not vector_db.is_ready:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Vector index is warming up",
+            headers={"Retry-After": "5"},
+        )
+
     try:
         # 获取原条目
-        entry = get_entry_by_id(db, entry_id)
+        entry = get_entry_by_id(db, entry_id, user_id=user_id)
         if not entry:
             raise HTTPException(status_code=404, detail="Entry not found")
 
-        # 生成查询的 embedding
-        print(f"Finding similar entries for ID: {entry_id}")
+        # 优先读取预先计算的结果
+        with span("neighbor_lookup"):
+            neighbors = neighbor_index.lookup(db, entry_id, limit, user_id=user_id)
+
+        if neighbors is not None:
+            similar_entries = [
+                SimilarEntry(
+                    id=result_entry.id,
+                    content=result_entry.content,
+                    entry_type=result_entry.entry_type,
+                    similarity=similarity,
+                    ai_analysis=result_entry.ai_analysis,
+                )
+                for result_entry, similarity in neighbors
+            ]
+        else:
+            similar_entries = search_similar_live(db, entry, limit, user_id)
+
+        log_event(
+            logger,
+            "similar_entries_found",
+            entry_id=entry_id,
+            count=len(similar_entries),
+        )
+        return similar_entries
+
+    except Exception as e:
+        log_event(
+            logger,
+            "find_similar_failed",
+            level=logging.ERROR,
+            entry_id=entry_id,
+            error=str(e),
+        )
+        raise HTTPException(
+            status_code=500, detail=f"Failed to find similar entries: {str(e)}"
+        )
+
+
+def search_similar_live(
+    db: Session, entry, limit: int, user_id: Optional[int]
+) -> List[SimilarEntry]:
+    """预先计算的结果不可用时，实时在向量索引中搜索"""
+    # 生成查询的 embedding
+    with span("embedding"):
         query_embedding = generate_embedding(entry.content)
 
-        # 在向量数据库中搜索
+    # 在向量数据库中搜索
+    with span("similarity_scan"):
         results = vector_db.search_similar(
-            query_embedding, n_results=limit + 1
+            query_embedding, n_results=limit + 1, user_id=user_id
         )  # +1 因为会包含自己
 
-        # 构建响应
-        similar_entries = []
-        if results and results["ids"] and len(results["ids"]) > 0:
-            for i, entry_id_str in enumerate(results["ids"][0]):
-                result_id = int(entry_id_str)
-
-                # 跳过自己
-                if result_id == entry_id:
-                    continue
-
-                # 获取条目详情
-                result_entry = get_entry_by_id(db, result_id)
-                if result_entry:
-                    # 获取相似度分数
-                    similarity = (
-                        1.0 - results["distances"][0][i]
-                        if "distances" in results
-                        else 0.0
-                    )
-
-                    similar_entries.append(
-                        SimilarEntry(
-                            id=result_entry.id,
-                            content=result_entry.content,
-                            entry_type=result_entry.entry_type,
-                            similarity=similarity,
-                            ai_analysis=result_entry.ai_analysis,
-                        )
+    # 构建响应
+    similar_entries = []
+    if results and results["ids"] and len(results["ids"]) > 0:
+        for i, entry_id_str in enumerate(results["ids"][0]):
+            result_id = int(entry_id_str)
+
+            # 跳过自己
+            if result_id == entry.id:
+                continue
+
+            # 获取条目详情
+            result_entry = get_entry_by_id(db, result_id, user_id=user_id)
+            if result_entry:
+                # 获取相似度分数
+                similarity = (
+                    1.0 - results["distances"][0][i] if "distances" in results else 0.0
+                )
+
+                similar_entries.append(
+                    SimilarEntry(
+                        id=result_entry.id,
+                        content=result_entry.content,
+                        entry_type=result_entry.entry_type,
+                        similarity=similarity,
+                        ai_analysis=result_entry.ai_analysis,
                     )
+                )
 
-                if len(similar_entries) >= limit:
-                    break
-
-        print(f"Found {len(similar_entries)} similar entries")
-        return similar_entries
-
-    except Exception as e:
-        print(f"Error finding similar entries: {e}")
-        raise HTTPException(
-            status_code=500, detail=f"Failed to find similar entries: {str(e)}"
-        )
+            if len(similar_entries) >= limit:
+                break
+    return similar_entries
 
 
 @app.delete("/entries/{entry_id}")
-async def delete_entry(entry_id: int, db: Session = Depends(get_db)):
+async def delete_entry(
+    entry_id: int,
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(get_current_user_id),
+):
     try:
-        success = delete_entry_by_id(db, entry_id)
+        success = delete_entry_by_id(db, entry_id, user_id=user_id)
         if not success:
             raise HTTPException(status_code=404, detail="Entry not found")
 
-        vector_db.delete_entry(entry_id)
+        with span("vector_write"):
+            vector_db.delete_entry(entry_id)
 
         return {"message": "Entry deleted successfully"}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error deleting entry: {e}")
+        log_event(
+            logger,
+            "delete_entry_failed",
+            level=logging.ERROR,
+            entry_id=entry_id,
+            error=str(e),
+        )
         raise HTTPException(status_code=500, detail=f"Failed to delete entry: {str(e)}")
 
 
+@app.get("/export")
+async def export_data(
+    format: str = "ndjson",
+    gzip: bool = False,
+    user_id: Optional[int] = Depends(get_current_user_id),
+):
+    """流式导出当前用户的全部条目（ndjson 或 csv，可选 gzip）"""
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    filename = f"entries.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_entries(user_id, fmt=format, compress=gzip),
+        media_type="application/gzip" if gzip else FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.post("/import")
+async def import_data(
+    request: Request,
+    format: str = "ndjson",
+    gzip: bool = False,
+    dedupe: bool = True,
+    user_id: Optional[int] = Depends(get_current_user_id),
+):
+    """
+    流式导入条目：请求体为 /export 产生的 ndjson 或 csv 文件（gzip=true 时为压缩文件）。
+    边接收边解析，按批次提交。id 由数据库重新分配；dedupe=true（默认）时跳过
+    内容、类型和创建时间都与已有条目相同的记录，重复导入同一文件不会产生副本
+    """
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+
+    body = request.stream()
+
+    async def next_chunk():
+        try:
+            return await body.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    def chunks():
+        # 在工作线程中按需从事件循环取下一块请求体
+        while True:
+            chunk = anyio.from_thread.run(next_chunk)
+            if chunk is None:
+                return
+            yield chunk
+
+    with span("import"):
+        report = await run_in_threadpool(
+            import_entries, chunks(), user_id, format, gzip, dedupe=dedupe
+        )
+    log_event(
+        logger,
+        "entries_imported",
+        imported=report["imported"],
+        skipped=report["skipped"],
+        duplicates=report["duplicates"],
+        aborted=report["aborted"],
+    )
+    return report
+
+
+@app.get("/stats")
+async def get_user_stats(
+    days: int = 30,
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(get_current_user_id),
+):
+    """当前用户的统计：每日新建/复习数、类型分布、常用标签、复习进度"""
+    days = max(1, min(days, 366))
+    return get_stats(db, user_id, days=days)
+
+
+@app.post("/admin/stats/recompute", dependencies=[Depends(require_admin)])
+async def recompute_user_stats(user_id: Optional[int] = None):
+    """从 entries 表重建物化统计，不指定 user_id 时重建所有用户"""
+
+    def run():
+        with engine.begin() as conn:
+            recompute_stats(conn, user_id)
+
+    started = time.perf_counter()
+    await run_in_threadpool(run)
+    return {"user_id": user_id, "seconds": time.perf_counter() - started}
+
+
+@app.post("/admin/claim-legacy", dependencies=[Depends(require_admin)])
+async def claim_legacy(username: str, db: Session = Depends(get_db)):
+    """把按用户隔离之前创建的条目（user_id 为空）转给指定用户"""
+    db_user = db.query(UserModel).filter(UserModel.username == username).first()
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    claimed = await run_in_threadpool(claim_legacy_entries, db_user.id)
+    return {"user_id": db_user.id, "claimed": claimed}
+
+
+@app.get("/review/due", response_model=List[ReviewEntry])
+async def get_review_queue(
+    limit: int = 20,
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(get_current_user_id),
+):
+    """获取当前用户最早到期的待复习条目"""
+    return get_due_entries(db, limit=limit, user_id=user_id)
+
+
+@app.post("/review/batch", response_model=ReviewBatchResponse)
+async def grade_review_batch(
+    batch: ReviewBatch,
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(get_current_user_id),
+):
+    """批量提交离线复习的评分，早于条目上次复习时间的评分放在 skipped 中返回"""
+    updated, not_found, skipped = grade_entries(
+        db,
+        ((item.entry_id, item.grade, item.reviewed_at) for item in batch.items),
+        user_id=user_id,
+    )
+    return ReviewBatchResponse(updated=updated, not_found=not_found, skipped=skipped)
+
+
+@app.post("/review/{entry_id}", response_model=ReviewEntry)
+async def grade_review(
+    entry_id: int,
+    review: ReviewGrade,
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(get_current_user_id),
+):
+    """提交一次复习评分，返回新的复习计划"""
+    updated, not_found, _ = grade_entries(
+        db, [(entry_id, review.grade, review.reviewed_at)], user_id=user_id
+    )
+    if not_found:
+        raise HTTPException(status_code=404, detail="Entry not found")
+    if not updated:
+        raise HTTPException(
+            status_code=409, detail="reviewed_at is earlier than the last review"
+        )
+    return updated[0]
+
+
+@app.get("/metrics/admission")
+async def admission_metrics():
+    """AI 接口准入控制的队列深度和等待时间"""
+    return llm_admission.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus 文本格式的指标"""
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles(limit: int = 20):
+    """列出最慢的已采样请求"""
+    return [record.to_dict() for record in request_profiler.slowest(limit)]
+
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def download_profile(profile_id: str, format: str = "pstats"):
+    """下载 profile：format=pstats 为二进制文件，format=text 为文本摘要"""
+    record = request_profiler.get(profile_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "text":
+        return PlainTextResponse(record.summary)
+    return Response(
+        content=record.stats,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{record.id}.prof"'},
+    )
+
+
+@app.post("/admin/consistency", dependencies=[Depends(require_admin)])
+async def start_consistency_check(repair: bool = False, workers: Optional[int] = None):
+    """在后台检查条目与向量存储是否一致，repair=true 时重建缺失/过期的向量"""
+    if not consistency_job.start(repair=repair, workers=workers):
+        raise HTTPException(status_code=409, detail="Consistency check already running")
+    return consistency_job.status()
+
+
+@app.get("/admin/consistency", dependencies=[Depends(require_admin)])
+async def get_consistency_report():
+    """最近一次一致性检查的结果"""
+    report = consistency_job.status()
+    if report is None:
+        raise HTTPException(status_code=404, detail="No consistency check has run")
+    return report
+
+
+@app.post("/admin/neighbors/rebuild", dependencies=[Depends(require_admin)])
+async def rebuild_neighbors(user_id: Optional[int] = None, all_users: bool = True):
+    """全量重新计算相似条目（all_users=false 时只重建 user_id 的分区）"""
+    if not vector_db.is_ready:
+        raise HTTPException(status_code=503, detail="Vector index is warming up")
+    started = time.perf_counter()
+    computed = await run_in_threadpool(neighbor_index.rebuild, user_id, all_users)
+    return {"computed": computed, "seconds": time.perf_counter() - started}
+
+
 @app.get("/device-id")
 async def get_device_info():
     """获取设备ID"""
@@ -240,19 +1016,27 @@ async def get_device_info():
 
 
 @app.post("/sync", response_model=SyncResponse)
-async def sync_data(request: SyncRequest, db: Session = Depends(get_db)):
-    """同步数据"""
+async def sync_data(
+    request: SyncRequest,
+    db: Session = Depends(get_db),
+    user_id: Optional[int] = Depends(get_current_user_id),
+):
+    """同步当前用户的数据"""
     try:
-        print(f"Syncing data from device: {request.device_id}")
-
-        server_entries, conflicts = sync_entries(
-            db, request.local_entries, request.device_id
-        )
+        with span("sync_apply"):
+            server_entries, conflicts = sync_entries(
+                db, request.local_entries, request.device_id, user_id=user_id
+            )
 
         last_sync_time = datetime.utcnow()
 
-        print(
-            f"Sync completed. Server entries: {len(server_entries)}, Conflicts: {len(conflicts)}"
+        log_event(
+            logger,
+            "sync_completed",
+            device_id=request.device_id,
+            uploaded=len(request.local_entries),
+            server_entries=len(server_entries),
+            conflicts=len(conflicts),
         )
 
         return SyncResponse(
@@ -261,41 +1045,16 @@ async def sync_data(request: SyncRequest, db: Session = Depends(get_db)):
             last_sync_time=last_sync_time,
         )
     except Exception as e:
-        print(f"Error syncing data: {e}")
+        log_event(
+            logger,
+            "sync_failed",
+            level=logging.ERROR,
+            device_id=request.device_id,
+            error=str(e),
+        )
         raise HTTPException(status_code=500, detail=f"Failed to sync data: {str(e)}")
 
 
-# 认证相关函数
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
-) -> Optional[UserModel]:
-    """获取当前用户"""
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-    except jwt.PyJWTError:
-        return None
-
-    user = db.query(UserModel).filter(UserModel.username == username).first()
-    return user
-
-
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    """创建访问令牌"""
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
-
-
 # 认证端点
 @app.post("/auth/register", response_model=Token)
 async def register(user: UserCreate, db: Session = Depends(get_db)):
@@ -316,13 +1075,19 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
         )
 
     # 创建用户
-    password_hash = bcrypt.hashpw(
-        user.password.encode("utf-8"), bcrypt.gensalt()
-    ).decode("utf-8")
+    password_hash = await hash_password(user.password)
+    first_user = not _has_users(db)
     db_user = UserModel(username=user.username, password_hash=password_hash)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    if first_user:
+        # 第一个用户认领按用户隔离之前创建的条目
+        claimed = await run_in_threadpool(claim_legacy_entries, db_user.id)
+        if claimed:
+            log_event(
+                logger, "legacy_entries_claimed", user_id=db_user.id, count=claimed
+            )
 
     # 生成 token
     access_token = create_access_token(data={"sub": user.username})
@@ -341,9 +1106,7 @@ async def login(user: UserLogin, db: Session = Depends(get_db)):
         )
 
     # 验证密码
-    if not bcrypt.checkpw(
-        user.password.encode("utf-8"), db_user.password_hash.encode("utf-8")
-    ):
+    if not await verify_password(user.password, db_user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="用户名或密码错误"
         )
@@ -354,6 +1117,40 @@ async def login(user: UserLogin, db: Session = Depends(get_db)):
     return Token(access_token=access_token, username=user.username)
 
 
+@app.post("/auth/change-password", response_model=Token)
+async def change_password(
+    data: PasswordChange,
+    current_user: Optional[UserModel] = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """修改密码，旧 token 全部失效并返回新 token"""
+    if current_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="未登录或登录已过期"
+        )
+
+    db_user = db.query(UserModel).filter(UserModel.id == current_user.id).first()
+    if not db_user or not await verify_password(
+        data.old_password, db_user.password_hash
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="原密码错误"
+        )
+
+    if len(data.new_password) < 6:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="密码至少需要6位"
+        )
+
+    db_user.password_hash = await hash_password(data.new_password)
+    db_user.password_changed_at = datetime.utcnow().replace(microsecond=0)
+    db.commit()
+    token_cache.invalidate_user(db_user.username)
+
+    access_token = create_access_token(data={"sub": db_user.username})
+    return Token(access_token=access_token, username=db_user.username)
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -3,14 +3,18 @@ from sqlalchemy import (
     Integer,
     String,
     Text,
+    Date,
     DateTime,
+    Float,
+    LargeBinary,
     create_engine,
     ForeignKey,
+    Index,
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
-from pydantic import BaseModel
+from datetime import datetime, timezone
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List, Dict, Any
 
 Base = declarative_base()
@@ -24,6 +28,8 @@ class User(Base):
     username = Column(String(50), unique=True, index=True, nullable=False)
     password_hash = Column(String(255), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # 修改密码的时间，早于该时间签发的 token 失效
+    password_changed_at = Column(DateTime, nullable=True)
 
 
 # SQLAlchemy ORM Model for Entry
@@ -44,6 +50,95 @@ class Entry(Base):
     sync_status = Column(String(20), default="synced")
     version = Column(Integer, default=1)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    # "ok" 或 "degraded"（AI 调用失败时保存了默认分析，稍后重新分析）
+    analysis_status = Column(String(20), default="ok")
+    # 降级条目重新分析失败的次数和下一次重试时间（指数退避）
+    analysis_attempts = Column(Integer, default=0)
+    next_analysis_at = Column(DateTime, nullable=True)
+    # SM-2 复习状态，新条目立即到期
+    ease_factor = Column(Float, default=2.5)
+    interval_days = Column(Integer, default=0)
+    repetitions = Column(Integer, default=0)
+    due_at = Column(DateTime, default=datetime.utcnow)
+    last_reviewed_at = Column(DateTime, nullable=True)
+    # 从 ai_analysis 中提取的结构化字段，用于按词性/句子功能筛选
+    part_of_speech = Column(String(30), nullable=True)
+    definition = Column(Text, nullable=True)
+    sentence_function = Column(String(50), nullable=True)
+    sentence_pattern = Column(Text, nullable=True)
+
+    # 所有查询都按用户过滤，索引以 user_id 开头
+    __table_args__ = (
+        Index("ix_entries_user_created", "user_id", "created_at"),
+        Index("ix_entries_user_updated", "user_id", "updated_at"),
+        Index("ix_entries_user_due", "user_id", "due_at"),
+        Index("ix_entries_analysis_retry", "analysis_status", "next_analysis_at"),
+        Index("ix_entries_user_pos", "user_id", "part_of_speech", "created_at"),
+        Index("ix_entries_user_function", "user_id", "sentence_function", "created_at"),
+    )
+
+
+# 向量存储：所有 worker 进程共享同一张表
+class EntryVector(Base):
+    __tablename__ = "entry_vectors"
+
+    entry_id = Column(Integer, primary_key=True)
+    embedding = Column(LargeBinary)  # float32 字节序列，删除后为空
+    content = Column(Text)
+    metadata_json = Column(Text)
+    # 向量按用户分区，搜索只扫描当前用户的向量
+    user_id = Column(Integer, nullable=True, index=True)
+    # 生成向量时条目的 version，与 entries.version 不一致说明向量已过期
+    entry_version = Column(Integer, nullable=True)
+    # 写入时的全局版本号，worker 据此增量刷新内存索引
+    generation = Column(Integer, nullable=False, index=True)
+    deleted = Column(Integer, default=0)
+
+
+# 预先计算的相似条目（每个条目在自己用户分区内的 top-k），没有行表示需要重新计算
+class EntryNeighbor(Base):
+    __tablename__ = "entry_neighbors"
+
+    entry_id = Column(Integer, primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    neighbor_id = Column(Integer, nullable=False, index=True)
+    similarity = Column(Float, nullable=False)
+    user_id = Column(Integer, nullable=True, index=True)
+
+    __table_args__ = (
+        # 新向量加入时按第 k 名的相似度筛选可能受影响的条目
+        Index("ix_entry_neighbors_user_rank", "user_id", "rank", "similarity"),
+    )
+
+
+class VectorStoreMeta(Base):
+    __tablename__ = "vector_store_meta"
+
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+
+
+# 按用户物化的统计数据，随条目的增删改增量更新
+# user_id 为 0 表示未登录用户（主键列不能为 NULL）
+class UserDailyStats(Base):
+    __tablename__ = "user_daily_stats"
+
+    user_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    entry_type = Column(String(20), primary_key=True)
+    created = Column(Integer, nullable=False, default=0)  # 当天创建且仍存在的条目数
+    reviewed = Column(Integer, nullable=False, default=0)
+    review_passed = Column(Integer, nullable=False, default=0)
+
+
+class UserTagStats(Base):
+    __tablename__ = "user_tag_stats"
+
+    user_id = Column(Integer, primary_key=True)
+    tag = Column(String(100), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (Index("ix_user_tag_stats_count", "user_id", "count"),)
 
 
 # Pydantic Models for API
@@ -89,11 +184,66 @@ class EntryResponse(BaseModel):
     ai_analysis: str
     tags: Optional[str]
     created_at: datetime
+    analysis_status: Optional[str] = "ok"
+    part_of_speech: Optional[str] = None
+    definition: Optional[str] = None
+    sentence_function: Optional[str] = None
+    sentence_pattern: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class ReviewEntry(BaseModel):
+    """待复习条目"""
+
+    id: int
+    content: str
+    entry_type: str
+    ai_analysis: str
+    tags: Optional[str]
+    ease_factor: float
+    interval_days: int
+    repetitions: int
+    due_at: datetime
+    last_reviewed_at: Optional[datetime]
 
     class Config:
         from_attributes = True
 
 
+class ReviewGrade(BaseModel):
+    """复习评分（SM-2，0-5）"""
+
+    grade: int = Field(ge=0, le=5)
+    reviewed_at: Optional[datetime] = None
+
+    @field_validator("reviewed_at")
+    @classmethod
+    def _to_naive_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        """带时区的时间转换为 UTC 并去掉时区，与数据库中的时间一致"""
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
+class ReviewBatchItem(ReviewGrade):
+    entry_id: int
+
+
+class ReviewBatch(BaseModel):
+    """离线复习后批量提交的评分"""
+
+    items: List[ReviewBatchItem]
+
+
+class ReviewBatchResponse(BaseModel):
+    updated: List[ReviewEntry]
+    not_found: List[int]
+    # 早于条目上次复习时间、未应用的评分
+    skipped: List[int] = []
+
+
 class SimilarEntry(BaseModel):
     """相似条目"""
 
@@ -156,6 +306,13 @@ class UserLogin(BaseModel):
     password: str
 
 
+class PasswordChange(BaseModel):
+    """修改密码"""
+
+    old_password: str
+    new_password: str
+
+
 class UserResponse(BaseModel):
     """用户响应"""
 
@@ -0,0 +1,399 @@
+"""
+预先计算的相似条目表
+
+每个条目在自己用户分区内的 top-k 相似条目保存在 entry_neighbors 表中，
+查询相似条目只需一次按 entry_id 的索引读取。
+
+- vector_db.add_entries / delete_entries 的回调只把变化的 id 放入待处理队列，
+  不在请求路径上计算；后台任务定期取出队列
+- 少量向量变化时只重新计算受影响的条目：新条目本身、原来把它列为近邻的条目，
+  以及与新向量的相似度超过自身第 k 名的条目
+- 受影响条目过多（批量导入、重建）时清空该分区的结果，交给后台任务按批次向量化重算
+- 没有行的条目视为过期，查询时回退到实时搜索；队列处理之前最多短暂返回旧结果
+"""
+
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from models import Base, Entry, EntryNeighbor
+
+NEIGHBOR_TOP_K = int(os.getenv("NEIGHBOR_TOP_K", "10"))
+# 受影响条目不超过该数量时增量更新，否则清空分区交给重建任务
+NEIGHBOR_INLINE_MAX = int(os.getenv("NEIGHBOR_INLINE_MAX", "200"))
+# 向量化计算时每批的条目数（每批占用 batch * 分区大小 个 float32）
+NEIGHBOR_BATCH = 512
+# IN 子句的参数数量上限
+_IN_CHUNK = 500
+
+
+def _chunks(items: List[int], size: int = _IN_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+class NeighborIndex:
+    def __init__(
+        self,
+        store,
+        top_k: int = NEIGHBOR_TOP_K,
+        inline_max: int = NEIGHBOR_INLINE_MAX,
+        bind=None,
+    ):
+        self.store = store
+        self.engine = bind if bind is not None else store.engine
+        self.top_k = top_k
+        self.inline_max = inline_max
+        self._lock = threading.Lock()
+        self._tables_ready = False
+        # 待处理的向量变化 {entry_id: "added" | "deleted"}，同一条目只保留最后一次
+        self._pending: Dict[int, str] = {}
+        self._pending_lock = threading.Lock()
+        # 供 rebuild_missing 检查的条目 id 和分区；分区为 None 表示检查所有分区（启动后第一次）
+        self._dirty_ids: set = set()
+        self._dirty_partitions: Optional[set] = None
+
+    def _ensure_table(self):
+        if not self._tables_ready:
+            Base.metadata.create_all(bind=self.engine, tables=[EntryNeighbor.__table__])
+            self._tables_ready = True
+
+    @staticmethod
+    def _owned_by(column, user_id: Optional[int]):
+        return column.is_(None) if user_id is None else column == user_id
+
+    def compute(self, user_id: Optional[int], entry_ids: Iterable[int]) -> Dict:
+        """在分区矩阵上按批次向量化计算 top-k，返回 {entry_id: [(neighbor_id, similarity)]}"""
+        ids, matrix = self.store.matrix(user_id)
+        position = {entry_id: i for i, entry_id in enumerate(ids)}
+        rows = [position[e] for e in entry_ids if e in position]
+        k = min(self.top_k, len(ids) - 1)
+        if k <= 0:
+            return {ids[i]: [] for i in rows}
+
+        result = {}
+        for start in range(0, len(rows), NEIGHBOR_BATCH):
+            batch = np.asarray(rows[start : start + NEIGHBOR_BATCH])
+            sims = matrix[batch] @ matrix.T
+            sims[np.arange(len(batch)), batch] = -np.inf  # 排除自己
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            top_sims = np.take_along_axis(sims, top, axis=1)
+            order = np.argsort(-top_sims, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            top_sims = np.take_along_axis(top_sims, order, axis=1)
+            for r, i in enumerate(batch):
+                result[ids[i]] = [
+                    (ids[j], float(s)) for j, s in zip(top[r], top_sims[r])
+                ]
+        return result
+
+    def _write(self, user_id: Optional[int], computed: Dict):
+        """替换这些条目的近邻行（一个事务）"""
+        if not computed:
+            return
+        rows = [
+            {
+                "entry_id": entry_id,
+                "rank": rank,
+                "neighbor_id": neighbor_id,
+                "similarity": similarity,
+                "user_id": user_id,
+            }
+            for entry_id, neighbors in computed.items()
+            for rank, (neighbor_id, similarity) in enumerate(neighbors)
+        ]
+        try:
+            with self.engine.begin() as conn:
+                for chunk in _chunks(list(computed)):
+                    conn.execute(
+                        delete(EntryNeighbor).where(EntryNeighbor.entry_id.in_(chunk))
+                    )
+                if rows:
+                    conn.execute(insert(EntryNeighbor), rows)
+        except IntegrityError:
+            # 另一个 worker 同时写入了同一条目，清空让后台任务重算
+            self.invalidate(computed)
+
+    def _delete_rows(self, entry_ids: List[int]):
+        with self.engine.begin() as conn:
+            for chunk in _chunks(entry_ids):
+                conn.execute(
+                    delete(EntryNeighbor).where(EntryNeighbor.entry_id.in_(chunk))
+                )
+
+    def invalidate(self, entry_ids: Iterable[int]):
+        """清空这些条目的结果，由 rebuild_missing 重算"""
+        entry_ids = list(entry_ids)
+        self._delete_rows(entry_ids)
+        with self._pending_lock:
+            self._dirty_ids.update(entry_ids)
+
+    def invalidate_partition(self, user_id: Optional[int]):
+        with self.engine.begin() as conn:
+            conn.execute(
+                delete(EntryNeighbor).where(
+                    self._owned_by(EntryNeighbor.user_id, user_id)
+                )
+            )
+        with self._pending_lock:
+            if self._dirty_partitions is not None:
+                self._dirty_partitions.add(user_id)
+
+    def _referencing(self, conn, entry_ids: List[int]) -> set:
+        """把这些条目列为近邻的条目"""
+        result = set()
+        for chunk in _chunks(entry_ids):
+            result.update(
+                conn.execute(
+                    select(EntryNeighbor.entry_id)
+                    .where(EntryNeighbor.neighbor_id.in_(chunk))
+                    .distinct()
+                ).scalars()
+            )
+        return result
+
+    def _by_owner(self, entry_ids: Iterable[int]) -> Dict[Optional[int], List[int]]:
+        """按所属分区分组（跳过已不在向量存储中的条目）"""
+        owners = self.store.owners
+        by_user: Dict[Optional[int], List[int]] = {}
+        for entry_id in entry_ids:
+            if entry_id in owners:
+                by_user.setdefault(owners[entry_id], []).append(entry_id)
+        return by_user
+
+    def _recompute_or_invalidate(self, affected: set):
+        """按分区重新计算受影响的条目；数量过多或索引未就绪时只清空"""
+        if not affected:
+            return
+        if not self.store.is_ready or len(affected) > self.inline_max:
+            self.invalidate(affected)
+            return
+        owners = self.store.owners
+        gone = [e for e in affected if e not in owners]
+        by_user = self._by_owner(affected)
+        if gone:
+            self.invalidate(gone)
+        for user_id, entry_ids in by_user.items():
+            self._write(user_id, self.compute(user_id, entry_ids))
+
+    def _thresholds(
+        self, conn, user_id: Optional[int], below: float
+    ) -> Dict[int, float]:
+        """
+        {entry_id: 第 k 名的相似度}，只返回低于 below（新向量的最大相似度）的条目。
+        只读取每个条目第 k 名的一行（走 (user_id, rank, similarity) 索引）
+        """
+        return {
+            row.entry_id: row.similarity
+            for row in conn.execute(
+                select(EntryNeighbor.entry_id, EntryNeighbor.similarity).where(
+                    self._owned_by(EntryNeighbor.user_id, user_id),
+                    EntryNeighbor.rank == self.top_k - 1,
+                    EntryNeighbor.similarity < below,
+                )
+            )
+        }
+
+    def on_vectors_changed(self, event: str, entry_ids: List[int]):
+        """vector_db 的回调：只记录变化，由后台任务调用 process_pending 处理"""
+        with self._pending_lock:
+            for entry_id in entry_ids:
+                self._pending[entry_id] = event
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def process_pending(self) -> int:
+        """后台任务：处理队列中的向量变化，返回处理的条目数"""
+        if not self._pending or not self.store.is_ready:
+            return 0
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        self._ensure_table()
+        self.store.refresh(force=True)
+        deleted = [e for e, event in pending.items() if event == "deleted"]
+        added = [e for e, event in pending.items() if event != "deleted"]
+        with self._lock:
+            if deleted:
+                self._on_deleted(deleted)
+            if added:
+                self._on_added(added)
+        return len(pending)
+
+    def _on_deleted(self, entry_ids: List[int]):
+        with self.engine.connect() as conn:
+            affected = self._referencing(conn, entry_ids) - set(entry_ids)
+        self.invalidate(entry_ids)
+        self._recompute_or_invalidate(affected)
+
+    def _on_added(self, entry_ids: List[int]):
+        with self.engine.connect() as conn:
+            # 更新已有向量时，原来引用它的条目也需要重算
+            affected = self._referencing(conn, entry_ids) | set(entry_ids)
+        if not self.store.is_ready or len(entry_ids) > self.inline_max:
+            self._invalidate_partitions(entry_ids, affected)
+            return
+
+        for user_id, added in self._by_owner(entry_ids).items():
+            ids, matrix = self.store.matrix(user_id)
+            if len(ids) - len(added) - 1 < self.top_k:
+                # 分区原来不足 k + 1 个条目，已有条目的近邻都不满 k 个
+                affected.update(ids)
+                continue
+            position = {entry_id: i for i, entry_id in enumerate(ids)}
+            rows = [position[e] for e in added if e in position]
+            # 每个已有条目与新向量的最大相似度
+            best = (matrix[rows] @ matrix.T).max(axis=0)
+            best[rows] = -np.inf
+            with self.engine.connect() as conn:
+                thresholds = self._thresholds(conn, user_id, float(best.max()))
+            for entry_id, lowest in thresholds.items():
+                i = position.get(entry_id)
+                if i is not None and best[i] > lowest:
+                    affected.add(entry_id)
+        self._recompute_or_invalidate(affected)
+
+    def _invalidate_partitions(self, entry_ids: List[int], affected: set):
+        """批量变化：清空涉及分区的全部结果，由后台任务重建"""
+        owners = self.store.owners
+        users = {owners[e] for e in entry_ids if e in owners}
+        for user_id in users:
+            self.invalidate_partition(user_id)
+        self.invalidate(affected)
+
+    def rebuild_missing(self) -> int:
+        """
+        后台任务：为被清空或变化过的条目重新计算，并清理已不在分区中的行。
+        只检查本进程清空的条目/分区和其他进程写入的向量，不扫描整个表。
+        返回重新计算的条目数
+        """
+        if not self.store.is_ready:
+            return 0
+        self._ensure_table()
+        self.store.refresh(force=True)
+        with self._pending_lock:
+            partitions, self._dirty_partitions = self._dirty_partitions, set()
+            entry_ids, self._dirty_ids = self._dirty_ids, set()
+        entry_ids |= self.store.take_external_changes()
+        if partitions is None:
+            partitions = set(self.store.partition_users())
+
+        computed_count = 0
+        for user_id in partitions:
+            computed_count += self._check_partition(user_id)
+        owner = self.store.owners
+        computed_count += self._check_entries(
+            [e for e in entry_ids if e not in owner or owner[e] not in partitions]
+        )
+        return computed_count
+
+    def _compute_batches(self, user_id: Optional[int], entry_ids: List[int]) -> int:
+        for start in range(0, len(entry_ids), NEIGHBOR_BATCH):
+            batch = entry_ids[start : start + NEIGHBOR_BATCH]
+            with self._lock:
+                self._write(user_id, self.compute(user_id, batch))
+        return len(entry_ids)
+
+    def _check_partition(self, user_id: Optional[int]) -> int:
+        """检查整个分区：补算没有行的条目，清理引用了分区外条目的行"""
+        ids, _ = self.store.matrix(user_id)
+        current = set(ids)
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(EntryNeighbor.entry_id, EntryNeighbor.neighbor_id).where(
+                    self._owned_by(EntryNeighbor.user_id, user_id)
+                )
+            ).all()
+        existing = {row.entry_id for row in rows}
+        # 行所属条目或近邻已不在分区中（其他进程删除/迁移了向量）
+        broken = {
+            row.entry_id
+            for row in rows
+            if row.entry_id not in current or row.neighbor_id not in current
+        }
+        if broken:
+            self._delete_rows(list(broken))
+        missing = [e for e in ids if e not in existing or e in broken]
+        if len(ids) < 2 or not missing:
+            return 0
+        return self._compute_batches(user_id, missing)
+
+    def _check_entries(self, entry_ids: List[int]) -> int:
+        """只检查这些条目：没有行或分区已变化的重算，引用了已删除/迁移条目的行重算"""
+        if not entry_ids:
+            return 0
+        owner = self.store.owners
+        first, referencing = {}, []
+        with self.engine.connect() as conn:
+            for chunk in _chunks(entry_ids):
+                first.update(
+                    conn.execute(
+                        select(EntryNeighbor.entry_id, EntryNeighbor.user_id).where(
+                            EntryNeighbor.entry_id.in_(chunk), EntryNeighbor.rank == 0
+                        )
+                    ).all()
+                )
+                referencing.extend(
+                    conn.execute(
+                        select(
+                            EntryNeighbor.entry_id,
+                            EntryNeighbor.neighbor_id,
+                            EntryNeighbor.user_id,
+                        ).where(EntryNeighbor.neighbor_id.in_(chunk))
+                    ).all()
+                )
+        stale = {
+            e
+            for e in entry_ids
+            if e in owner and (e not in first or first[e] != owner[e])
+        }
+        stale.update(
+            row.entry_id
+            for row in referencing
+            if row.neighbor_id not in owner or owner[row.neighbor_id] != row.user_id
+        )
+        # 分区太小时不会重新写入，先删掉旧行
+        clear = [e for e in set(entry_ids) | stale if e not in owner or e in stale]
+        if clear:
+            self._delete_rows(clear)
+
+        computed_count = 0
+        for user_id, ids in self._by_owner(stale).items():
+            if self.store.partition_size(user_id) >= 2:
+                computed_count += self._compute_batches(user_id, ids)
+        return computed_count
+
+    def rebuild(self, user_id: Optional[int] = None, all_users: bool = True) -> int:
+        """全量重建（all_users 为 False 时只重建 user_id 的分区）"""
+        self._ensure_table()
+        if all_users:
+            with self.engine.begin() as conn:
+                conn.execute(delete(EntryNeighbor))
+            with self._pending_lock:
+                self._dirty_partitions = None
+        else:
+            self.invalidate_partition(user_id)
+        return self.rebuild_missing()
+
+    def lookup(self, db, entry_id: int, limit: int, user_id: Optional[int] = None):
+        """
+        读取预先计算的相似条目，返回 [(Entry, similarity)]；
+        没有结果（过期或尚未计算）或 limit 超过 top_k 时返回 None
+        """
+        if limit > self.top_k:
+            return None
+        self._ensure_table()
+        query = (
+            db.query(Entry, EntryNeighbor.similarity)
+            .join(EntryNeighbor, EntryNeighbor.neighbor_id == Entry.id)
+            .filter(EntryNeighbor.entry_id == entry_id)
+        )
+        # 队列处理之前，已删除的条目可能仍在近邻行中
+        query = query.filter(self._owned_by(Entry.user_id, user_id), Entry.deleted == 0)
+        rows = query.order_by(EntryNeighbor.rank).limit(limit).all()
+        return rows or None
@@ -0,0 +1,143 @@
+import cProfile
+import io
+import marshal
+import pstats
+import random
+import threading
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+
+@dataclass
+class ProfileRecord:
+    """一次被采样请求的 profile"""
+
+    id: str
+    method: str
+    path: str
+    route: str
+    status_code: int
+    latency: float
+    captured_at: datetime
+    stats: bytes  # marshal 格式，可用 pstats / snakeviz 打开
+    summary: str  # 按累计耗时排序的文本摘要
+    # 采集期间同时在处理的其他请求数，大于 0 时 profile 中混有这些请求的调用
+    overlapping: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status_code": self.status_code,
+            "latency": self.latency,
+            "captured_at": self.captured_at,
+            "overlapping": self.overlapping,
+        }
+
+
+class RequestProfiler:
+    """
+    按需的请求 profiling
+    - 请求头携带管理员令牌，或按 sample_rate 随机采样时启用
+    - cProfile 同一时间只能有一个在运行，忙时直接跳过
+    - 结果保存在有界环形缓冲区中
+    注意：
+    - cProfile 只统计事件循环线程上的调用，线程池中执行的部分只体现为等待时间
+    - cProfile 作用于整个事件循环线程，采集期间并发请求的协程也会计入本次 profile。
+      随机采样只在没有其他请求时进行；强制采集照常进行，并在 overlapping 中记录
+      并发的请求数，结果需要结合该字段解读
+    """
+
+    def __init__(self, capacity: int = 50, sample_rate: float = 0.0):
+        self.sample_rate = sample_rate
+        self._records: "deque[ProfileRecord]" = deque(maxlen=capacity)
+        self._records_lock = threading.Lock()
+        self._active = threading.Lock()
+        self._count_lock = threading.Lock()
+        self._in_flight = 0
+        self._overlapping = 0
+
+    def request_started(self):
+        with self._count_lock:
+            self._in_flight += 1
+            if self._active.locked():
+                self._overlapping += 1
+
+    def request_finished(self):
+        with self._count_lock:
+            self._in_flight -= 1
+
+    def should_profile(self, forced: bool) -> bool:
+        return forced or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self, forced: bool = False) -> Optional[cProfile.Profile]:
+        """
+        开始 profiling（调用方需已调用 request_started）。
+        已有 profile 在进行，或随机采样时有其他请求在处理，返回 None
+        """
+        with self._count_lock:
+            others = self._in_flight - 1
+            if not forced and others > 0:
+                return None
+            if not self._active.acquire(blocking=False):
+                return None
+            self._overlapping = others
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 其他工具（如调试器）已经启用了 profiler
+            self._active.release()
+            return None
+        return profiler
+
+    def finish(
+        self,
+        profiler: cProfile.Profile,
+        method: str,
+        path: str,
+        route: str,
+        status_code: int,
+        latency: float,
+    ):
+        profiler.disable()
+        with self._count_lock:
+            overlapping = self._overlapping
+            self._active.release()
+        profiler.create_stats()
+        # pstats.Stats 会取走 profiler.stats，先序列化
+        stats = marshal.dumps(profiler.stats)
+
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(30)
+        record = ProfileRecord(
+            id=uuid.uuid4().hex[:12],
+            method=method,
+            path=path,
+            route=route,
+            status_code=status_code,
+            latency=latency,
+            captured_at=datetime.utcnow(),
+            stats=stats,
+            summary=summary.getvalue(),
+            overlapping=overlapping,
+        )
+        with self._records_lock:
+            self._records.append(record)
+
+    def slowest(self, limit: int = 20) -> List[ProfileRecord]:
+        with self._records_lock:
+            records = list(self._records)
+        return sorted(records, key=lambda r: r.latency, reverse=True)[:limit]
+
+    def get(self, profile_id: str) -> Optional[ProfileRecord]:
+        with self._records_lock:
+            for record in self._records:
+                if record.id == profile_id:
+                    return record
+        return None
@@ -0,0 +1,203 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，快速失败"""
+
+
+class DeadlineExceeded(Exception):
+    """调用超过了总的截止时间"""
+
+
+class CircuitBreaker:
+    """
+    简单的熔断器
+    - closed: 正常放行，连续失败达到阈值后打开
+    - open: 直接拒绝，等待 recovery_timeout 秒后进入 half_open
+    - half_open: 只放行一个探测请求，成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state_locked()
+
+    def _state_locked(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.recovery_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """判断当前是否允许发起调用"""
+        with self._lock:
+            state = self._state_locked()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """记录最近的调用耗时，用于计算对冲请求的触发阈值"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class ResilientCaller:
+    """
+    为上游调用提供：总截止时间、带抖动的指数退避重试、熔断、以及可选的对冲请求。
+    被包装的函数接收一个参数 timeout（本次尝试可用的秒数）。
+    """
+
+    def __init__(
+        self,
+        deadline: float = 20.0,
+        attempt_timeout: float = 10.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 4.0,
+        breaker: Optional[CircuitBreaker] = None,
+        hedge_enabled: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_min_samples: int = 20,
+    ):
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyTracker()
+        # 对冲请求需要并发执行两次调用
+        self._executor = ThreadPoolExecutor(
+            max_workers=8, thread_name_prefix="llm-hedge"
+        )
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge_enabled or len(self.latency) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    def _attempt(self, fn: Callable[[float], T], timeout: float) -> T:
+        started = time.monotonic()
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is None or hedge_delay >= timeout:
+            result = fn(timeout)
+            self.latency.record(time.monotonic() - started)
+            return result
+
+        # 对冲：主请求超过 p95 仍未返回时，再发一个请求，取先成功的结果
+        primary = self._executor.submit(fn, timeout)
+        done, _ = wait([primary], timeout=hedge_delay)
+        if done:
+            result = primary.result()
+            self.latency.record(time.monotonic() - started)
+            return result
+
+        remaining = max(0.1, timeout - (time.monotonic() - started))
+        hedge = self._executor.submit(fn, remaining)
+        pending = {primary, hedge}
+        last_error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(
+                pending,
+                timeout=max(0.0, timeout - (time.monotonic() - started)),
+                return_when=FIRST_COMPLETED,
+            )
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    self.latency.record(time.monotonic() - started)
+                    return future.result()
+                last_error = future.exception()
+        if last_error is not None:
+            raise last_error
+        raise TimeoutError(f"Upstream call timed out after {timeout:.1f}s")
+
+    def call(self, fn: Callable[[float], T]) -> T:
+        """执行调用，失败时抛出最后一次的异常"""
+        deadline_at = time.monotonic() + self.deadline
+        last_error: Optional[BaseException] = None
+
+        for attempt in range(self.max_retries + 1):
+            # 先检查截止时间，避免拿到半开探测名额后却不调用，导致熔断器一直不放行
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                break
+
+            if not self.breaker.allow():
+                raise CircuitOpenError("LLM upstream circuit is open")
+
+            try:
+                result = self._attempt(fn, min(self.attempt_timeout, remaining))
+                self.breaker.record_success()
+                return result
+            except Exception as e:
+                self.breaker.record_failure()
+                last_error = e
+
+            if attempt < self.max_retries:
+                # full jitter 退避
+                backoff = random.uniform(
+                    0, min(self.backoff_max, self.backoff_base * (2**attempt))
+                )
+                if time.monotonic() + backoff >= deadline_at:
+                    break
+                time.sleep(backoff)
+
+        if last_error is not None:
+            raise last_error
+        raise DeadlineExceeded(f"LLM call exceeded deadline of {self.deadline:.1f}s")
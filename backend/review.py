@@ -0,0 +1,57 @@
+"""
+SM-2 间隔重复算法
+
+评分 grade 取 0-5：
+    5 完全记得  4 犹豫后记得  3 费力记得
+    2 记错但看到答案觉得熟悉  1 记错  0 完全不记得
+grade >= 3 视为记住，间隔按 1 天、6 天、之后乘以 ease 增长；否则重新开始。
+"""
+
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+PASS_GRADE = 3
+
+
+class Schedule(NamedTuple):
+    ease_factor: float
+    interval_days: int
+    repetitions: int
+    due_at: datetime
+
+
+def next_schedule(
+    ease_factor: float,
+    interval_days: int,
+    repetitions: int,
+    grade: int,
+    reviewed_at: datetime,
+) -> Schedule:
+    """根据本次评分计算下一次复习时间"""
+    ease_factor = ease_factor or DEFAULT_EASE
+    interval_days = interval_days or 0
+    repetitions = repetitions or 0
+
+    if grade >= PASS_GRADE:
+        if repetitions == 0:
+            interval_days = 1
+        elif repetitions == 1:
+            interval_days = 6
+        else:
+            interval_days = max(1, round(interval_days * ease_factor))
+        repetitions += 1
+    else:
+        repetitions = 0
+        interval_days = 1
+
+    miss = 5 - grade
+    ease_factor = max(MIN_EASE, ease_factor + 0.1 - miss * (0.08 + miss * 0.02))
+
+    return Schedule(
+        ease_factor=ease_factor,
+        interval_days=interval_days,
+        repetitions=repetitions,
+        due_at=reviewed_at + timedelta(days=interval_days),
+    )
@@ -0,0 +1,312 @@
+"""
+物化的用户统计
+
+user_daily_stats 记录每个用户每天每种类型的新建条目数和复习次数，
+user_tag_stats 记录每个标签下的条目数。条目写入时在同一事务中累加增量，
+/stats 只需读取 O(天数) 行；recompute_stats 可从 entries 表全量重建。
+当前到期的条目数随时间变化、无法物化，最多只数到 DUE_NOW_CAP 条。
+
+用法（在 backend 目录下运行）：
+    python stats.py --recompute
+"""
+
+import argparse
+from collections import Counter, defaultdict
+from collections.abc import Mapping
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import Entry, UserDailyStats, UserTagStats
+
+# 标签列长度
+MAX_TAG_LENGTH = 100
+_DAILY_COUNTERS = ("created", "reviewed", "review_passed")
+# /stats 中 due_now 的计数上限，超过时 due_now_capped 为 true（前端显示为 "1000+"）
+DUE_NOW_CAP = 1000
+
+
+def _upsert_insert(conn):
+    """
+    返回支持 on_conflict_do_update 的 insert 构造函数，数据库不支持时返回 None。
+    先 UPDATE 再 INSERT 在并发写入同一行时会违反主键约束，单条 upsert 则是原子的
+    """
+    bind = conn.get_bind() if isinstance(conn, Session) else conn
+    name = bind.dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        return None
+    return upsert
+
+
+def _user_key(user_id: Optional[int]) -> int:
+    return user_id or 0
+
+
+def _split_tags(tags: Optional[str]):
+    if not tags:
+        return []
+    return {t.strip()[:MAX_TAG_LENGTH] for t in tags.split(",") if t.strip()}
+
+
+def _day(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    return value or datetime.utcnow().date()
+
+
+class StatsDelta:
+    """累积一批统计增量，在调用方的事务中一次性写入"""
+
+    def __init__(self):
+        # {(user_id, day, entry_type): Counter(created=, reviewed=, review_passed=)}
+        self.daily: Dict[tuple, Counter] = defaultdict(Counter)
+        # {(user_id, tag): count}
+        self.tags: Counter = Counter()
+
+    def entry_added(self, entry, sign: int = 1):
+        """entry 可以是 ORM 对象或带同名属性/键的行"""
+        get = entry.get if isinstance(entry, Mapping) else entry.__getattribute__
+        user = _user_key(get("user_id"))
+        key = (user, _day(get("created_at")), get("entry_type") or "word")
+        self.daily[key]["created"] += sign
+        for tag in _split_tags(get("tags")):
+            self.tags[(user, tag)] += sign
+
+    def entry_removed(self, entry):
+        self.entry_added(entry, sign=-1)
+
+    def entry_reviewed(self, entry, reviewed_at: datetime, passed: bool):
+        key = (
+            _user_key(entry.user_id),
+            _day(reviewed_at),
+            entry.entry_type or "word",
+        )
+        self.daily[key]["reviewed"] += 1
+        self.daily[key]["review_passed"] += int(passed)
+
+    def apply(self, conn):
+        """写入增量（conn 可以是 Session 或 Connection），写入后清空"""
+        daily = []
+        for (user, day, entry_type), counts in self.daily.items():
+            if any(counts.values()):
+                daily.append(
+                    {
+                        "user_id": user,
+                        "day": day,
+                        "entry_type": entry_type,
+                        **{k: counts.get(k, 0) for k in _DAILY_COUNTERS},
+                    }
+                )
+        tags = [
+            {"user_id": user, "tag": tag, "count": count}
+            for (user, tag), count in self.tags.items()
+            if count
+        ]
+        upsert = _upsert_insert(conn)
+        if upsert is not None:
+            if daily:
+                statement = upsert(UserDailyStats)
+                conn.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=["user_id", "day", "entry_type"],
+                        set_={
+                            k: getattr(UserDailyStats, k) + statement.excluded[k]
+                            for k in _DAILY_COUNTERS
+                        },
+                    ),
+                    daily,
+                )
+            if tags:
+                statement = upsert(UserTagStats)
+                conn.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=["user_id", "tag"],
+                        set_={
+                            "count": UserTagStats.count + statement.excluded["count"]
+                        },
+                    ),
+                    tags,
+                )
+        else:
+            self._apply_fallback(conn, daily, tags)
+
+        self.daily.clear()
+        self.tags.clear()
+
+    @staticmethod
+    def _apply_fallback(conn, daily, tags):
+        """不支持 ON CONFLICT 的数据库：先更新，没有行时再插入"""
+        for row in daily:
+            updated = conn.execute(
+                update(UserDailyStats)
+                .where(
+                    UserDailyStats.user_id == row["user_id"],
+                    UserDailyStats.day == row["day"],
+                    UserDailyStats.entry_type == row["entry_type"],
+                )
+                .values(
+                    {
+                        getattr(UserDailyStats, k): getattr(UserDailyStats, k) + row[k]
+                        for k in _DAILY_COUNTERS
+                    }
+                )
+            )
+            if updated.rowcount == 0:
+                conn.execute(insert(UserDailyStats).values(**row))
+        for row in tags:
+            updated = conn.execute(
+                update(UserTagStats)
+                .where(
+                    UserTagStats.user_id == row["user_id"],
+                    UserTagStats.tag == row["tag"],
+                )
+                .values(count=UserTagStats.count + row["count"])
+            )
+            if updated.rowcount == 0:
+                conn.execute(insert(UserTagStats).values(**row))
+
+
+def get_stats(conn, user_id: Optional[int], days: int = 30) -> dict:
+    """从物化表读取用户的统计数据"""
+    user = _user_key(user_id)
+
+    type_mix = {
+        row.entry_type: row.total
+        for row in conn.execute(
+            select(
+                UserDailyStats.entry_type,
+                func.sum(UserDailyStats.created).label("total"),
+            )
+            .where(UserDailyStats.user_id == user)
+            .group_by(UserDailyStats.entry_type)
+        )
+    }
+    review_totals = conn.execute(
+        select(
+            func.coalesce(func.sum(UserDailyStats.reviewed), 0),
+            func.coalesce(func.sum(UserDailyStats.review_passed), 0),
+        ).where(UserDailyStats.user_id == user)
+    ).one()
+
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    daily: Dict[date, dict] = {}
+    for row in conn.execute(
+        select(UserDailyStats)
+        .where(UserDailyStats.user_id == user, UserDailyStats.day >= since)
+        .order_by(UserDailyStats.day)
+    ).scalars():
+        item = daily.setdefault(
+            row.day,
+            {"day": row.day, "created": 0, "by_type": {}, "reviewed": 0, "passed": 0},
+        )
+        item["created"] += row.created
+        item["by_type"][row.entry_type] = row.created
+        item["reviewed"] += row.reviewed
+        item["passed"] += row.review_passed
+
+    top_tags = [
+        {"tag": row.tag, "count": row.count}
+        for row in conn.execute(
+            select(UserTagStats.tag, UserTagStats.count)
+            .where(UserTagStats.user_id == user, UserTagStats.count > 0)
+            .order_by(UserTagStats.count.desc())
+            .limit(10)
+        )
+    ]
+
+    owner = Entry.user_id.is_(None) if user_id is None else Entry.user_id == user_id
+    # 从来不复习的用户所有条目都已到期，限制读取的行数
+    due = (
+        select(Entry.id)
+        .where(owner, Entry.due_at <= datetime.utcnow(), Entry.deleted == 0)
+        .limit(DUE_NOW_CAP + 1)
+        .subquery()
+    )
+    due_now = conn.execute(select(func.count()).select_from(due)).scalar()
+
+    reviewed, passed = review_totals
+    return {
+        "total_entries": sum(type_mix.values()),
+        "type_mix": type_mix,
+        "daily": list(daily.values()),
+        "top_tags": top_tags,
+        "review": {
+            "due_now": min(due_now, DUE_NOW_CAP),
+            "due_now_capped": due_now > DUE_NOW_CAP,
+            "reviewed": reviewed,
+            "passed": passed,
+            "pass_rate": passed / reviewed if reviewed else None,
+        },
+    }
+
+
+def recompute_stats(conn, user_id: Optional[int] = None, batch_size: int = 5000):
+    """
+    从 entries 表重建新建条目数和标签统计（user_id 为 None 时重建所有用户）。
+    复习次数无法从条目还原，保留原值。
+    """
+    daily_filter, tag_filter, entry_filter = [], [], [Entry.deleted == 0]
+    if user_id is not None:
+        daily_filter.append(UserDailyStats.user_id == user_id)
+        tag_filter.append(UserTagStats.user_id == user_id)
+        entry_filter.append(Entry.user_id == user_id)
+
+    conn.execute(update(UserDailyStats).where(*daily_filter).values(created=0))
+    conn.execute(delete(UserTagStats).where(*tag_filter))
+
+    delta = StatsDelta()
+    result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+        select(Entry.user_id, Entry.created_at, Entry.entry_type, Entry.tags).where(
+            *entry_filter
+        )
+    )
+    for partition in result.mappings().partitions(batch_size):
+        for row in partition:
+            delta.entry_added(row)
+    delta.apply(conn)
+
+
+def reassign_stats(conn, from_user_id: Optional[int], to_user_id: int):
+    """把一个用户的统计合并到另一个用户（认领旧条目后调用，条目已改为新用户）"""
+    source = _user_key(from_user_id)
+    delta = StatsDelta()
+    for row in conn.execute(
+        select(
+            UserDailyStats.day,
+            UserDailyStats.entry_type,
+            UserDailyStats.reviewed,
+            UserDailyStats.review_passed,
+        ).where(UserDailyStats.user_id == source)
+    ):
+        key = (to_user_id, row.day, row.entry_type)
+        delta.daily[key]["reviewed"] += row.reviewed
+        delta.daily[key]["review_passed"] += row.review_passed
+    conn.execute(delete(UserDailyStats).where(UserDailyStats.user_id == source))
+    conn.execute(delete(UserTagStats).where(UserTagStats.user_id == source))
+    delta.apply(conn)
+    recompute_stats(conn, to_user_id)
+
+
+def main():
+    from database import engine, init_db
+
+    parser = argparse.ArgumentParser(description="Rebuild materialized user stats")
+    parser.add_argument("--recompute", action="store_true")
+    parser.add_argument("--user-id", type=int, default=None)
+    args = parser.parse_args()
+
+    init_db()
+    if args.recompute:
+        with engine.begin() as conn:
+            recompute_stats(conn, args.user_id)
+        print("Stats recomputed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+条目的流式导出 / 导入
+
+导出从服务端游标按固定大小分块读取，逐块编码为 NDJSON 或 CSV（可选 gzip）；
+导入增量解析上传内容，按批次在独立的短事务中写入。两者的内存占用都与条目总数无关。
+
+导出文件中的 id 不会被导入（由数据库重新分配），因此以
+(content, entry_type, created_at) 识别重复：默认跳过用户已有的相同条目，
+同一个文件重复导入（如恢复备份）不会产生副本。
+"""
+
+import codecs
+import csv
+import io
+import json
+import math
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import insert, select
+
+from ai_service import generate_embedding
+from database import analysis_fields, engine, get_device_id, vector_db
+from models import Entry
+from review import DEFAULT_EASE
+from stats import StatsDelta
+
+EXPORT_CHUNK = 500
+IMPORT_BATCH = 500
+MAX_REPORTED_ERRORS = 20
+
+EXPORT_FIELDS = [
+    "id",
+    "content",
+    "entry_type",
+    "source",
+    "note",
+    "ai_analysis",
+    "tags",
+    "created_at",
+    "updated_at",
+    "version",
+    "ease_factor",
+    "interval_days",
+    "repetitions",
+    "due_at",
+    "last_reviewed_at",
+]
+
+_DATETIME_FIELDS = {"created_at", "updated_at", "due_at", "last_reviewed_at"}
+_INT_FIELDS = {"version", "interval_days", "repetitions"}
+_FLOAT_FIELDS = {"ease_factor"}
+# 有长度限制的字符串列
+_MAX_LENGTHS = {"entry_type": 20, "source": 200}
+_INT_MAX = 2**31 - 1
+# 导入时可以写入的字段（id 由数据库重新分配）
+_IMPORT_FIELDS = [f for f in EXPORT_FIELDS if f != "id"]
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+class ImportFormatError(ValueError):
+    """上传内容无法解析"""
+
+
+def _iter_rows(user_id: Optional[int], chunk_size: int) -> Iterator[List[dict]]:
+    """用服务端游标按块读取用户的条目"""
+    columns = [getattr(Entry, field) for field in EXPORT_FIELDS]
+    owner = Entry.user_id.is_(None) if user_id is None else Entry.user_id == user_id
+    query = select(*columns).where(owner, Entry.deleted == 0).order_by(Entry.id)
+    with engine.connect() as conn:
+        result = conn.execution_options(
+            stream_results=True, yield_per=chunk_size
+        ).execute(query)
+        for partition in result.mappings().partitions(chunk_size):
+            yield [dict(row) for row in partition]
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _ndjson_chunks(chunks: Iterable[List[dict]]) -> Iterator[str]:
+    for rows in chunks:
+        yield "".join(
+            json.dumps(
+                {k: _encode_value(v) for k, v in row.items()}, ensure_ascii=False
+            )
+            + "\n"
+            for row in rows
+        )
+
+
+def _csv_chunks(chunks: Iterable[List[dict]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for rows in chunks:
+        writer.writerows({k: _encode_value(v) for k, v in row.items()} for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_entries(
+    user_id: Optional[int],
+    fmt: str = "ndjson",
+    compress: bool = False,
+    chunk_size: int = EXPORT_CHUNK,
+) -> Iterator[bytes]:
+    """逐块生成导出文件的字节"""
+    encode = _csv_chunks if fmt == "csv" else _ndjson_chunks
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    for text in encode(_iter_rows(user_id, chunk_size)):
+        data = text.encode("utf-8")
+        if compressor is not None:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def _iter_lines(chunks: Iterable[bytes], compressed: bool) -> Iterator[str]:
+    """把上传的字节块增量解压、解码并切分为行（保留换行符，供 csv 处理多行字段）"""
+    decompressor = zlib.decompressobj(wbits=31) if compressed else None
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    for chunk in chunks:
+        if decompressor is not None:
+            try:
+                chunk = decompressor.decompress(chunk)
+            except zlib.error as e:
+                raise ImportFormatError(f"Invalid gzip data: {e}")
+        # 只按 \n 切分：内容中可能含有 U+2028 等其他换行字符
+        *lines, pending = (pending + decoder.decode(chunk)).split("\n")
+        for line in lines:
+            yield line + "\n"
+    if decompressor is not None:
+        pending += decoder.decode(decompressor.flush())
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def _parse_value(field: str, value):
+    """解析并校验一个字段，类型不符时抛出 TypeError / ValueError（该记录计入 skipped）"""
+    if value is None or value == "":
+        return None
+    if field in _DATETIME_FIELDS:
+        if not isinstance(value, str):
+            raise TypeError(f"{field} must be an ISO 8601 string")
+        return datetime.fromisoformat(value)
+    if isinstance(value, bool):
+        raise TypeError(f"{field} must not be a boolean")
+    if field in _INT_FIELDS:
+        if isinstance(value, float) and not value.is_integer():
+            raise ValueError(f"{field} must be an integer")
+        if not isinstance(value, (int, float, str)):
+            raise TypeError(f"{field} must be an integer")
+        value = int(value)
+        if not 0 <= value <= _INT_MAX:
+            raise ValueError(f"{field} is out of range")
+        return value
+    if field in _FLOAT_FIELDS:
+        if not isinstance(value, (int, float, str)):
+            raise TypeError(f"{field} must be a number")
+        value = float(value)
+        if not math.isfinite(value):
+            raise ValueError(f"{field} must be finite")
+        return value
+    if field == "ai_analysis" and isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    if not isinstance(value, str):
+        raise TypeError(f"{field} must be a string")
+    if len(value) > _MAX_LENGTHS.get(field, len(value)):
+        raise ValueError(f"{field} is longer than {_MAX_LENGTHS[field]} characters")
+    return value
+
+
+def _parse_records(lines: Iterator[str], fmt: str) -> Iterator[dict]:
+    if fmt == "csv":
+        yield from csv.DictReader(lines)
+        return
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ImportFormatError(f"Line {number}: {e}")
+        if not isinstance(record, dict):
+            raise ImportFormatError(f"Line {number}: expected a JSON object")
+        yield record
+
+
+def _to_row(record: dict, user_id: Optional[int], device_id: str) -> dict:
+    row = {field: _parse_value(field, record.get(field)) for field in _IMPORT_FIELDS}
+    if not row["content"]:
+        raise ValueError("content is required")
+    row["entry_type"] = row["entry_type"] or "word"
+    row["ai_analysis"] = row["ai_analysis"] or "{}"
+    row.update(analysis_fields(row["ai_analysis"]))
+    now = datetime.utcnow()
+    for field in ("created_at", "updated_at", "due_at"):
+        row[field] = row[field] or now
+    row["version"] = row["version"] or 1
+    row["ease_factor"] = row["ease_factor"] or DEFAULT_EASE
+    row["interval_days"] = row["interval_days"] or 0
+    row["repetitions"] = row["repetitions"] or 0
+    row.update(user_id=user_id, device_id=device_id, sync_status="synced", deleted=0)
+    return row
+
+
+def _dedupe_key(row) -> tuple:
+    return (row["content"], row["entry_type"], row["created_at"])
+
+
+def _drop_duplicates(rows: List[dict], user_id: Optional[int]) -> List[dict]:
+    """去掉用户已有的条目和批次内重复的条目"""
+    owner = Entry.user_id.is_(None) if user_id is None else Entry.user_id == user_id
+    created = list({row["created_at"] for row in rows})
+    with engine.connect() as conn:
+        existing = {
+            _dedupe_key(row)
+            for row in conn.execute(
+                select(Entry.content, Entry.entry_type, Entry.created_at).where(
+                    owner, Entry.deleted == 0, Entry.created_at.in_(created)
+                )
+            ).mappings()
+        }
+    unique = []
+    for row in rows:
+        key = _dedupe_key(row)
+        if key not in existing:
+            existing.add(key)
+            unique.append(row)
+    return unique
+
+
+def _write_batch(rows: List[dict]) -> List[int]:
+    """在一个事务中写入一批条目，并写入对应的向量"""
+    delta = StatsDelta()
+    for row in rows:
+        delta.entry_added(row)
+    with engine.begin() as conn:
+        ids = (
+            conn.execute(
+                insert(Entry).returning(Entry.id, sort_by_parameter_order=True), rows
+            )
+            .scalars()
+            .all()
+        )
+        delta.apply(conn)
+    vector_db.add_entries(
+        {
+            "entry_id": entry_id,
+            "content": row["content"],
+            "embedding": generate_embedding(row["content"]),
+            "metadata": {"entry_type": row["entry_type"], "tags": row["tags"]},
+            "user_id": row["user_id"],
+            "entry_version": row["version"],
+        }
+        for entry_id, row in zip(ids, rows)
+    )
+    return ids
+
+
+def import_entries(
+    chunks: Iterable[bytes],
+    user_id: Optional[int],
+    fmt: str = "ndjson",
+    compressed: bool = False,
+    batch_size: int = IMPORT_BATCH,
+    dedupe: bool = True,
+) -> Dict:
+    """
+    从字节块流中导入条目。单条记录的错误只跳过该条；
+    内容格式错误时停止导入，已提交的批次会保留。
+    dedupe 为 True 时跳过 (content, entry_type, created_at) 与已有条目相同的记录，
+    计入 duplicates；为 False 时全部作为新条目写入
+    """
+    device_id = get_device_id()
+    report = {
+        "imported": 0,
+        "skipped": 0,
+        "duplicates": 0,
+        "errors": [],
+        "aborted": False,
+    }
+    batch: List[dict] = []
+
+    def flush():
+        if not batch:
+            return
+        rows = _drop_duplicates(batch, user_id) if dedupe else batch
+        report["duplicates"] += len(batch) - len(rows)
+        if rows:
+            report["imported"] += len(_write_batch(rows))
+        batch.clear()
+
+    records = _parse_records(_iter_lines(chunks, compressed), fmt)
+    try:
+        for number, record in enumerate(records, start=1):
+            try:
+                batch.append(_to_row(record, user_id, device_id))
+            except (TypeError, ValueError) as e:
+                report["skipped"] += 1
+                if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                    report["errors"].append(f"Record {number}: {e}")
+                continue
+            if len(batch) >= batch_size:
+                flush()
+    except (ImportFormatError, csv.Error) as e:
+        flush()
+        report["errors"].append(str(e))
+        report["aborted"] = True
+        return report
+    flush()
+    return report
@@ -32,7 +32,7 @@ function Login({ onLogin }) {
         setSuccess('注册成功！正在登录...')
         
         setTimeout(() => {
-          localStorage.setItem('token', response.data.token)
+          localStorage.setItem('english_study_token', response.data.access_token)
           localStorage.setItem('username', username)
           onLogin(username)
         }, 500)
@@ -42,7 +42,7 @@ function Login({ onLogin }) {
           password
         })
         
-        localStorage.setItem('token', response.data.token)
+        localStorage.setItem('english_study_token', response.data.access_token)
         localStorage.setItem('username', username)
         onLogin(username)
       }